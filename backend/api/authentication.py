@@ -0,0 +1,89 @@
+import copy
+import threading
+import time
+
+from django.conf import settings
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+from api.metrics import record_cache
+
+_tokens = {}
+_lock = threading.Lock()
+
+
+def forget_token(key):
+    with _lock:
+        _tokens.pop(key, None)
+
+
+def forget_user(user_id):
+    """Drops every cached token of the user in this process."""
+    with _lock:
+        for key in [key for key, (_, token) in _tokens.items()
+                    if token.user_id == user_id]:
+            del _tokens[key]
+
+
+def _remember(key, token, now):
+    with _lock:
+        if len(_tokens) >= settings.AUTH_TOKEN_CACHE_SIZE:
+            for stale in [stale for stale, (expires, _) in _tokens.items()
+                          if expires <= now]:
+                del _tokens[stale]
+            if len(_tokens) >= settings.AUTH_TOKEN_CACHE_SIZE:
+                _tokens.clear()
+        _tokens[key] = (now + settings.AUTH_TOKEN_CACHE_TTL, token)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication that keeps resolved tokens in process memory for
+    AUTH_TOKEN_CACHE_TTL seconds, so most safe requests skip the
+    token/user query. Unsafe requests always load the user fresh: they may
+    save it, and a cached copy can be up to the TTL out of date. Entries
+    are dropped on logout and on any save or deletion of the user
+    (password change, deactivation) in the current process; other workers
+    see the change once their entry expires.
+    """
+
+    def authenticate(self, request):
+        self.cacheable = request.method in SAFE_METHODS
+        return super().authenticate(request)
+
+    def authenticate_credentials(self, key):
+        now = time.monotonic()
+        with _lock:
+            entry = _tokens.get(key)
+        if self.cacheable and entry is not None and entry[0] > now:
+            record_cache('auth_token', 'hit')
+            token = entry[1]
+        else:
+            if self.cacheable:
+                record_cache('auth_token', 'miss')
+            # Свежий пользователь из записи годится и для следующих чтений.
+            _, token = super().authenticate_credentials(key)
+            _remember(key, token, now)
+        # Копия на каждый запрос: вьюхи могут менять пользователя, а
+        # запросы обрабатываются параллельно.
+        return copy.copy(token.user), token
+
+
+class StatelessJWTAuthentication(JWTAuthentication):
+    """
+    Signed-token mode, enabled by AUTH_STATELESS_TOKENS. Safe requests are
+    authenticated from the token claims alone, without touching the
+    database: `request.user` is then a `TokenUser` carrying only the id.
+    Unsafe requests load the real user as usual.
+    """
+
+    def authenticate(self, request):
+        self.stateless = request.method in SAFE_METHODS
+        return super().authenticate(request)
+
+    def get_user(self, validated_token):
+        if self.stateless:
+            return jwt_settings.TOKEN_USER_CLASS(validated_token)
+        return super().get_user(validated_token)
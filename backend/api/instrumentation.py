@@ -0,0 +1,69 @@
+import time
+from contextvars import ContextVar
+
+request_stats = ContextVar('sql_instrumentation', default=None)
+
+
+class RequestStats:
+    """Queries and phase timings collected for one request."""
+
+    def __init__(self):
+        self.view = None
+        self.queries = []
+        self.db = 0.0
+        self.serialize = 0.0
+        self.serializer = None
+        self.render_started = None
+        self.render = 0.0
+
+    def source(self):
+        """
+        The serializer field being rendered, e.g. `UserSerializer.
+        is_subscribed`, the serializer itself when it builds the output
+        by hand, or `view` outside serialization.
+        """
+        serializer = self.serializer
+        if serializer is None:
+            return 'view'
+        name = type(serializer).__name__
+        field = getattr(serializer, '_instrumented_field', None)
+        return f'{name}.{field}' if field else name
+
+
+class InstrumentedSerializerMixin:
+    """
+    Reports serialization to `QueryInstrumentationMiddleware`: the time
+    spent in the outermost serializer and the field whose rendering
+    issued each query. Costs one context variable lookup per object when
+    `SQL_INSTRUMENTATION` is off.
+    """
+
+    def to_representation(self, instance):
+        stats = request_stats.get()
+        if stats is None:
+            return super().to_representation(instance)
+        outer = stats.serializer
+        stats.serializer = self
+        start = time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            stats.serializer = outer
+            # Вложенные сериализаторы уже учтены во внешнем.
+            if outer is None:
+                stats.serialize += time.perf_counter() - start
+
+    @property
+    def _readable_fields(self):
+        fields = super()._readable_fields
+        if request_stats.get() is None:
+            return fields
+        return self._tracked_fields(fields)
+
+    def _tracked_fields(self, fields):
+        try:
+            for field in fields:
+                self._instrumented_field = field.field_name
+                yield field
+        finally:
+            self._instrumented_field = None
@@ -0,0 +1,117 @@
+import os
+
+from django.conf import settings
+from django.db import connection
+from django.http import HttpResponse
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from prometheus_client.core import GaugeMetricFamily
+
+# С PROMETHEUS_MULTIPROC_DIR значения пишутся в mmap-файлы каталога, и
+# страница метрик любого воркера отдаёт сумму по всем воркерам.
+REQUEST_LATENCY = Histogram(
+    'foodgram_request_duration_seconds',
+    'Время ответа до первого байта.',
+    ['view', 'method', 'status'],
+    buckets=(.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10),
+)
+RESPONSE_SIZE = Histogram(
+    'foodgram_response_size_bytes',
+    'Размер тела ответа (без потоковых ответов).',
+    ['view'],
+    buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304),
+)
+REQUEST_QUERIES = Histogram(
+    'foodgram_request_queries',
+    'SQL-запросов за один запрос к API.',
+    ['view'],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100),
+)
+IN_FLIGHT = Gauge(
+    'foodgram_requests_in_flight',
+    'Запросов в обработке.',
+    multiprocess_mode='livesum',
+)
+CACHE_REQUESTS = Counter(
+    'foodgram_cache_requests',
+    'Обращения к кешам: hit, stale (отдано устаревшее) или miss.',
+    ['cache', 'result'],
+)
+
+
+def record_cache(name, result):
+    # Без метрик счётчик не трогаем: в режиме multiprocess каждое
+    # обращение к кешу писало бы в mmap-файл.
+    if settings.METRICS_ENABLED:
+        CACHE_REQUESTS.labels(name, result).inc()
+
+
+def view_label(view_func, method):
+    """
+    `RecipeViewSet.download_shopping_cart` for DRF views, the function
+    name otherwise. Never the URL itself, which would explode the number
+    of series with every recipe id.
+    """
+    cls = getattr(view_func, 'cls', None)
+    if cls is None:
+        return view_func.__name__
+    method = method.lower()
+    actions = getattr(view_func, 'actions', None) or {}
+    return f'{cls.__name__}.{actions.get(method, method)}'
+
+
+class DatabaseCollector:
+    """
+    Connections to the project database by state, read from
+    `pg_stat_activity` at scrape time: the same for every worker, so it
+    is not aggregated like the per-process metrics.
+    """
+
+    def collect(self):
+        if connection.vendor != 'postgresql':
+            return
+        connections = GaugeMetricFamily(
+            'foodgram_db_connections',
+            'Соединения с базой по состоянию.',
+            labels=['state'],
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT coalesce(state, %s), count(*) FROM pg_stat_activity '
+                'WHERE datname = current_database() GROUP BY 1',
+                ['unknown'],
+            )
+            for state, count in cursor.fetchall():
+                connections.add_metric([state], count)
+            cursor.execute("SELECT current_setting('max_connections')::int")
+            limit = GaugeMetricFamily(
+                'foodgram_db_max_connections',
+                'Предел соединений сервера базы.',
+                value=cursor.fetchone()[0],
+            )
+        yield connections
+        yield limit
+
+
+_database_registry = CollectorRegistry(auto_describe=False)
+_database_registry.register(DatabaseCollector())
+
+
+def metrics_view(request):
+    """Prometheus text format, summed over all gunicorn workers."""
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    output = generate_latest(registry)
+    output += generate_latest(_database_registry)
+    return HttpResponse(output, content_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,144 @@
+import json
+import logging
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+from api import metrics
+from api.instrumentation import RequestStats, request_stats
+
+logger = logging.getLogger(__name__)
+
+
+class QueryInstrumentationMiddleware:
+    """
+    Counts and times SQL queries of every request and reports them in
+    `Server-Timing` (db, serialize, render) and `X-Query-Count` headers.
+    Slow queries and statements repeated within one request (N+1) are
+    logged as JSON lines naming the view and the serializer field that
+    issued them; serializers report themselves through
+    `InstrumentedSerializerMixin`. Enabled by `SQL_INSTRUMENTATION`;
+    queries of streamed response bodies are not counted.
+    """
+
+    def __init__(self, get_response):
+        if not settings.SQL_INSTRUMENTATION:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = RequestStats()
+        token = request_stats.set(stats)
+        try:
+            with connection.execute_wrapper(self._execute):
+                response = self.get_response(request)
+        finally:
+            request_stats.reset(token)
+        response['X-Query-Count'] = str(len(stats.queries))
+        response['Server-Timing'] = ', '.join((
+            f'db;dur={stats.db * 1000:.1f};'
+            f'desc="{len(stats.queries)} queries"',
+            f'serialize;dur={stats.serialize * 1000:.1f}',
+            f'render;dur={stats.render * 1000:.1f}',
+        ))
+        self._log(request, stats)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        stats = request_stats.get()
+        match = request.resolver_match
+        stats.view = match.view_name if match else view_func.__name__
+
+    def process_template_response(self, request, response):
+        # Ответы DRF рендерятся после всех process_template_response.
+        stats = request_stats.get()
+        stats.render_started = time.perf_counter()
+        response.add_post_render_callback(
+            lambda response: self._rendered(stats)
+        )
+        return response
+
+    @staticmethod
+    def _rendered(stats):
+        stats.render = time.perf_counter() - stats.render_started
+
+    @staticmethod
+    def _execute(execute, sql, params, many, context):
+        stats = request_stats.get()
+        if stats is None:
+            return execute(sql, params, many, context)
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            stats.db += duration
+            stats.queries.append((sql, duration, stats.source()))
+
+    @staticmethod
+    def _log(request, stats):
+        base = {'view': stats.view, 'method': request.method,
+                'path': request.path}
+        repeated = defaultdict(list)
+        for sql, duration, source in stats.queries:
+            repeated[sql].append((duration, source))
+            if duration * 1000 >= settings.SQL_SLOW_QUERY_MS:
+                logger.warning(json.dumps({
+                    'event': 'slow_query', **base, 'source': source,
+                    'duration_ms': round(duration * 1000, 1), 'sql': sql,
+                }, ensure_ascii=False))
+        for sql, runs in repeated.items():
+            if len(runs) >= settings.SQL_DUPLICATE_QUERY_MIN:
+                logger.warning(json.dumps({
+                    'event': 'duplicate_query', **base,
+                    'sources': sorted({source for _, source in runs}),
+                    'count': len(runs),
+                    'duration_ms': round(
+                        sum(duration for duration, _ in runs) * 1000, 1
+                    ),
+                    'sql': sql,
+                }, ensure_ascii=False))
+
+
+class MetricsMiddleware:
+    """
+    Feeds the Prometheus metrics of `api.metrics`: latency, response size
+    and query count per view, and requests in flight. Enabled by
+    `METRICS_ENABLED`. Streamed responses are timed to the first byte.
+    """
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = 0
+
+        def count(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        request.metrics_view = 'unmatched'
+        metrics.IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            with connection.execute_wrapper(count):
+                response = self.get_response(request)
+        finally:
+            metrics.IN_FLIGHT.dec()
+        view = request.metrics_view
+        metrics.REQUEST_LATENCY.labels(
+            view, request.method, response.status_code
+        ).observe(time.perf_counter() - start)
+        metrics.REQUEST_QUERIES.labels(view).observe(queries)
+        if not response.streaming:
+            metrics.RESPONSE_SIZE.labels(view).observe(len(response.content))
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.metrics_view = metrics.view_label(view_func, request.method)
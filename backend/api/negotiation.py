@@ -0,0 +1,16 @@
+from rest_framework.negotiation import DefaultContentNegotiation
+
+
+class FormatContentNegotiation(DefaultContentNegotiation):
+    """
+    Picks the renderer from `?format=` only and ignores the Accept header,
+    falling back to the first renderer. Unknown formats give 404.
+    """
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        format_query = format_suffix or request.query_params.get(
+            self.settings.URL_FORMAT_OVERRIDE
+        )
+        if format_query:
+            renderers = self.filter_renderers(renderers, format_query)
+        return renderers[0], renderers[0].media_type
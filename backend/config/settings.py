@@ -1,4 +1,5 @@
 import os
+from datetime import timedelta
 from pathlib import Path
 
 from django.core.management.utils import get_random_secret_key
@@ -34,6 +35,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'api.apps.ApiConfig',
     'rest_framework.authtoken',
     'rest_framework',
@@ -45,6 +47,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.MetricsMiddleware',
+    'api.middleware.QueryInstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -89,6 +93,80 @@ DATABASES = {
 }
 
 
+CACHES = {
+    'default': (
+        {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+        if os.getenv('REDIS_URL') else
+        {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    )
+}
+
+RECIPES_CACHE_TIMEOUT = int(os.getenv('RECIPES_CACHE_TIMEOUT', 10 * 60))
+RECIPES_CACHE_FRESH_TIMEOUT = int(
+    os.getenv('RECIPES_CACHE_FRESH_TIMEOUT', 60)
+)
+RECIPES_CACHE_LOCK_TIMEOUT = 5
+
+INGREDIENT_INDEX_TTL = 10 * 60
+
+# Сколько совпадений поиска ранжируется и считается для пагинации.
+# Нечётких совпадений по триграммам меньше: при малом LIMIT Postgres
+# читает индекс GiST до первых найденных, а не целиком.
+RECIPE_SEARCH_CANDIDATES = int(os.getenv('RECIPE_SEARCH_CANDIDATES', 1000))
+RECIPE_SEARCH_FUZZY_CANDIDATES = 50
+
+BULK_RELATIONS_MAX_RECIPES = 500
+
+MEDIA_CLEANUP_DELAY = 1
+
+AUTH_TOKEN_CACHE_TTL = int(os.getenv('AUTH_TOKEN_CACHE_TTL', 30))
+AUTH_TOKEN_CACHE_SIZE = 10_000
+# Подписанные JWT без похода в базу на безопасных запросах. Такой токен
+# нельзя отозвать, поэтому срок жизни у него короткий.
+AUTH_STATELESS_TOKENS = os.getenv(
+    'AUTH_STATELESS_TOKENS', 'False'
+).lower() in ('true', '1', 'yes')
+SIMPLE_JWT = {
+    'ACCESS_TOKEN_LIFETIME': timedelta(minutes=5),
+    'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
+}
+
+# Счётчики и время SQL-запросов в заголовках ответа и лог медленных
+# и повторяющихся запросов. Каждый запрос к базе дороже, поэтому
+# по умолчанию выключено.
+SQL_INSTRUMENTATION = os.getenv(
+    'SQL_INSTRUMENTATION', 'False'
+).lower() in ('true', '1', 'yes')
+SQL_SLOW_QUERY_MS = int(os.getenv('SQL_SLOW_QUERY_MS', 100))
+SQL_DUPLICATE_QUERY_MIN = 3
+
+# Метрики Prometheus на /internal/metrics/. С несколькими воркерами
+# gunicorn нужен PROMETHEUS_MULTIPROC_DIR (см. gunicorn.conf.py).
+METRICS_ENABLED = os.getenv(
+    'METRICS_ENABLED', 'False'
+).lower() in ('true', '1', 'yes')
+
+SHORT_LINK_MIN_LENGTH = 5
+SHORT_LINK_CACHE_SIZE = 100_000
+
+SHOPPING_LIST_CHUNK_SIZE = 500
+SHOPPING_LIST_CACHE_TIMEOUT = 60 * 60
+SHOPPING_LIST_CACHE_MAX_SIZE = 1024 * 1024
+SHOPPING_LIST_PDF_MAX_INFLIGHT = int(
+    os.getenv('SHOPPING_LIST_PDF_MAX_INFLIGHT', 4)
+)
+SHOPPING_LIST_PDF_SLOT_TIMEOUT = 60
+SHOPPING_LIST_PDF_FONT = os.getenv(
+    'SHOPPING_LIST_PDF_FONT',
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -136,7 +214,9 @@ REST_FRAMEWORK = {
     ],
 
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        *(['api.authentication.StatelessJWTAuthentication']
+          if AUTH_STATELESS_TOKENS else []),
+        'api.authentication.CachedTokenAuthentication',
     ],
 
     'DEFAULT_PAGINATION_CLASS': 'recipes.pagination.RecipesPagination',
@@ -16,6 +16,14 @@ urlpatterns = [
     path('s/<str:code>/', shortlink_redirect, name='short-link'),
 ]
 
+if settings.METRICS_ENABLED:
+    from api.metrics import metrics_view
+
+    # Только для сети docker: gateway закрывает /internal/ снаружи.
+    urlpatterns.append(
+        path('internal/metrics/', metrics_view, name='metrics')
+    )
+
 if settings.DEBUG:
     urlpatterns += static(
         settings.MEDIA_URL,
@@ -7,6 +7,7 @@ For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/wsgi/
 """
 
+import logging
 import os
 
 from django.core.wsgi import get_wsgi_application
@@ -14,3 +15,14 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
 application = get_wsgi_application()
+
+from recipes.ingredient_index import ingredient_index  # noqa: E402
+
+try:
+    ingredient_index.build()
+except Exception:
+    # Прогрев необязателен: если база или кеш (Redis) ещё недоступны,
+    # индекс соберётся при первом запросе, а воркер всё равно стартует.
+    logging.getLogger(__name__).warning(
+        'Индекс ингредиентов не собран при запуске.', exc_info=True
+    )
@@ -0,0 +1,23 @@
+import os
+import shutil
+
+# Каталог для метрик воркеров нужен только с включёнными метриками:
+# иначе prometheus_client зря писал бы mmap-файлы в каждом воркере.
+# Воркеры наследуют окружение мастера и импортируют метрики уже с ним.
+if os.getenv('METRICS_ENABLED', 'False').lower() in ('true', '1', 'yes'):
+    os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/prometheus')
+
+
+def on_starting(server):
+    # Файлы метрик прошлого запуска исказили бы счётчики.
+    path = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if path:
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path)
+
+
+def child_exit(server, worker):
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
@@ -2,7 +2,6 @@ from django.contrib import admin
 from django.contrib.auth import get_user_model
 from django.contrib.auth.admin import UserAdmin as DjangoUserAdmin
 from django.contrib.auth.models import Group
-from django.db.models import Count
 
 from .models import Ingredient, Recipe, RecipeIngredient, Tag
 
@@ -49,8 +48,7 @@ class RecipeAdmin(admin.ModelAdmin):
     )
 
     def get_queryset(self, request):
-        qs = super().get_queryset(request)
-        return qs.annotate(favourites_count=Count('favourites'))
+        return super().get_queryset(request).select_related('author')
 
     @admin.display(description='Автор')
     def author_name(self, obj):
@@ -58,11 +56,6 @@ class RecipeAdmin(admin.ModelAdmin):
         last = obj.author.last_name or ''
         return f'{first} {last}'.strip() or obj.author.username
 
-    @admin.display(description='Добавлений в избранное',
-                   ordering='favourites_count')
-    def favourites_count(self, obj):
-        return obj.favourites_count
-
 
 @admin.register(Tag)
 class TagAdmin(admin.ModelAdmin):
@@ -80,10 +73,12 @@ class IngredientAdmin(admin.ModelAdmin):
 
 @admin.register(User)
 class UserAdmin(DjangoUserAdmin):
-    list_display = ('username', 'email', 'first_name', 'last_name')
+    list_display = ('username', 'email', 'first_name', 'last_name',
+                    'recipes_count', 'followers_count')
     search_fields = ('username', 'email',)
     list_filter = ('is_active', 'is_staff', 'is_superuser')
-    readonly_fields = ('last_login', 'date_joined')
+    readonly_fields = ('last_login', 'date_joined',
+                       'recipes_count', 'followers_count')
 
 
 admin.site.empty_value_display = 'Не задано'
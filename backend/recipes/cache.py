@@ -0,0 +1,154 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework.response import Response
+
+from api.metrics import record_cache
+
+RECIPES_VERSION = 'recipes'
+TAGS_VERSION = 'tags'
+INGREDIENTS_VERSION = 'ingredients'
+
+
+def user_version(user_id):
+    """Version of a user's favourites, shopping cart and subscriptions."""
+    return f'user:{user_id}'
+
+
+def cart_version(user_id):
+    """Version of a user's shopping cart contents."""
+    return f'cart:{user_id}'
+
+
+def profile_version(user_id):
+    """Version of a user's public profile shown as a recipe author."""
+    return f'profile:{user_id}'
+
+
+def get_versions(*names):
+    """
+    Returns the versions of the given data sets. A version is the time of
+    the last change in nanoseconds, so it can also serve as Last-Modified.
+    Every cached response is stamped with the versions it was computed for,
+    so bumping one invalidates all of them at once.
+    """
+    keys = [f'version:{name}' for name in names]
+    found = cache.get_many(keys)
+    missing = [key for key in keys if key not in found]
+    if missing:
+        # Ключ мог быть вытеснен: стартуем с текущего времени, чтобы
+        # не совпасть с версией уже лежащих в кэше ответов.
+        now = time.time_ns()
+        for key in missing:
+            cache.add(key, now, timeout=None)
+        found.update(cache.get_many(missing))
+        return [found.get(key, now) for key in keys]
+    return [found[key] for key in keys]
+
+
+def get_version(name):
+    return get_versions(name)[0]
+
+
+def bump_versions(*names):
+    now = time.time_ns()
+    cache.set_many({f'version:{name}': now for name in names}, timeout=None)
+
+
+def bump_versions_on_commit(*names):
+    """
+    Bumps versions only after the surrounding transaction commits, otherwise
+    a concurrent request could cache the old data under the new version.
+    """
+    transaction.on_commit(lambda: bump_versions(*names))
+
+
+def make_key(request, prefix):
+    """Builds a cache key from the path and normalized query params."""
+    params = sorted(
+        (key, sorted(request.query_params.getlist(key)))
+        for key in request.query_params
+    )
+    raw = repr((request.build_absolute_uri(request.path), params))
+    return f'{prefix}:{hashlib.md5(raw.encode()).hexdigest()}'
+
+
+def get_or_compute(key, compute):
+    """
+    Returns the cached value for `key`, recomputing it with `compute` when it
+    is missing, stale or was computed for an older version of the data.
+
+    Only one worker recomputes at a time: the others keep serving the stale
+    value while it is being refreshed, or briefly wait for it on a cold miss.
+    """
+    version = get_version(RECIPES_VERSION)
+    entry = cache.get(key)
+    if (entry is not None and entry['version'] == version
+            and entry['fresh_until'] > time.time()):
+        record_cache('recipes', 'hit')
+        return entry['data']
+
+    lock_key = f'{key}:lock'
+    lock_timeout = settings.RECIPES_CACHE_LOCK_TIMEOUT
+    if not cache.add(lock_key, 1, timeout=lock_timeout):
+        if entry is not None:
+            record_cache('recipes', 'stale')
+            return entry['data']
+        deadline = time.monotonic() + lock_timeout
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            entry = cache.get(key)
+            if entry is not None:
+                return entry['data']
+        return compute()
+
+    record_cache('recipes', 'miss')
+    try:
+        data = compute()
+        cache.set(key, {
+            'version': version,
+            'fresh_until': (
+                time.time() + settings.RECIPES_CACHE_FRESH_TIMEOUT
+            ),
+            'data': data,
+        }, timeout=settings.RECIPES_CACHE_TIMEOUT)
+    finally:
+        cache.delete(lock_key)
+    return data
+
+
+class AnonymousCacheMixin:
+    """
+    Serves `list` and `retrieve` for anonymous users from the shared cache.
+    Anonymous users always get the same flags, so the page only depends on
+    the query params and the version of recipe data.
+    """
+
+    def list(self, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return super().list(request, *args, **kwargs)
+        return self._cached_response(
+            request, 'recipes:list',
+            lambda: super(AnonymousCacheMixin, self).list(
+                request, *args, **kwargs
+            )
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return super().retrieve(request, *args, **kwargs)
+        return self._cached_response(
+            request, 'recipes:detail',
+            lambda: super(AnonymousCacheMixin, self).retrieve(
+                request, *args, **kwargs
+            )
+        )
+
+    def _cached_response(self, request, prefix, get_response):
+        data = get_or_compute(
+            make_key(request, prefix), lambda: get_response().data
+        )
+        return Response(data)
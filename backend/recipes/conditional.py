@@ -0,0 +1,71 @@
+import hashlib
+
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+from recipes.cache import get_versions
+
+
+class ConditionalGetMixin:
+    """
+    Adds ETag / Last-Modified to `list` and `retrieve` and answers
+    `If-None-Match` / `If-Modified-Since` with 304 before the queryset is
+    evaluated or anything is serialized.
+
+    Validators are built from cached data versions (see `recipes.cache`),
+    listed in `version_names`; views may extend them per request.
+    """
+    version_names = ()
+
+    def get_version_names(self, request):
+        return list(self.version_names)
+
+    def get_list_validators(self, request):
+        return self.make_validators(
+            request, get_versions(*self.get_version_names(request))
+        )
+
+    def get_object_validators(self, request):
+        return self.get_list_validators(request)
+
+    def make_validators(self, request, versions, *extra):
+        """
+        Returns (etag, last_modified). Versions are change timestamps in
+        nanoseconds, so the newest of them is the Last-Modified date.
+        """
+        raw = repr((
+            request.get_full_path(),
+            request.accepted_media_type,
+            request.user.pk,
+            *versions,
+            *extra,
+        ))
+        etag = quote_etag(hashlib.md5(raw.encode()).hexdigest())
+        return etag, max(versions) // 10 ** 9
+
+    def list(self, request, *args, **kwargs):
+        return self._conditional(
+            request, self.get_list_validators(request),
+            super().list, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._conditional(
+            request, self.get_object_validators(request),
+            super().retrieve, *args, **kwargs
+        )
+
+    def _conditional(self, request, validators, handler, *args, **kwargs):
+        if validators is None:
+            return handler(request, *args, **kwargs)
+        etag, last_modified = validators
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            response = handler(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            response.headers['ETag'] = etag
+            response.headers['Last-Modified'] = http_date(last_modified)
+        patch_vary_headers(response, ('Accept', 'Authorization'))
+        return response
@@ -3,5 +3,9 @@ TAG_NAME_MAX_LENGTH = 32
 TAG_SLUG_MAX_LENGTH = 32
 DEFAULT_CHARFIELD_MAX_LENGTH = 64
 CHARFIELD_MAX_LENGTH_LARGE = 128
+IMPORT_SOURCE_MAX_LENGTH = 255
 COOKING_TIME_MIN_VALUE = 1
 AMOUNT_TIME_MIN_VALUE = 1
+RECIPE_ID_MAX_VALUE = 2 ** 63 - 1
+SEARCH_CONFIG = 'russian'
+BASE64_DECODE_CHUNK_SIZE = 64 * 1024
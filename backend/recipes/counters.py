@@ -0,0 +1,67 @@
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from recipes.models import Favourites, Recipe
+from users.models import Follow
+
+User = get_user_model()
+
+
+def increment(queryset, field, delta=1):
+    """Atomically shifts a stored counter, never going below zero."""
+    return queryset.update(**{field: Greatest(F(field) + delta, Value(0))})
+
+
+def increment_many(queryset, field, deltas):
+    """
+    Applies {pk: delta} to a stored counter with one UPDATE per distinct
+    delta instead of one per row.
+    """
+    by_delta = {}
+    for pk, delta in deltas.items():
+        by_delta.setdefault(delta, []).append(pk)
+    for delta, pks in by_delta.items():
+        increment(queryset.filter(pk__in=pks), field, delta)
+
+
+def _count_subquery(queryset, field):
+    return Coalesce(
+        Subquery(
+            queryset.filter(**{field: OuterRef('pk')})
+            .order_by()
+            .values(field)
+            .annotate(total=Count('pk'))
+            .values('total')
+        ),
+        Value(0),
+    )
+
+
+def _repair(queryset, field, actual):
+    return (
+        queryset.annotate(actual=actual)
+        .exclude(**{field: F('actual')})
+        .update(**{field: actual})
+    )
+
+
+def recount_all():
+    """
+    Recomputes every stored counter from the source tables and returns how
+    many rows had drifted, per counter.
+    """
+    return {
+        'favourites_count': _repair(
+            Recipe.objects.all(), 'favourites_count',
+            _count_subquery(Favourites.objects.all(), 'recipe'),
+        ),
+        'recipes_count': _repair(
+            User.objects.all(), 'recipes_count',
+            _count_subquery(Recipe.objects.all(), 'author'),
+        ),
+        'followers_count': _repair(
+            User.objects.all(), 'followers_count',
+            _count_subquery(Follow.objects.all(), 'following'),
+        ),
+    }
@@ -1,11 +1,21 @@
 import base64
+import binascii
+import re
 
-from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import TemporaryUploadedFile
 from rest_framework import serializers
 
+from recipes.constants import BASE64_DECODE_CHUNK_SIZE
+
+BASE64_MARKER = ';base64,'
+WHITESPACE = re.compile(r'\s+')
+
 
 class Base64ImageField(serializers.ImageField):
-    """A custom serializer field for handling base64-encoded images. """
+    """
+    A custom serializer field for handling base64-encoded images. Regular
+    uploaded files, e.g. from a multipart request, are accepted as is.
+    """
     def to_internal_value(self, data):
         if self._is_base64(data):
             data = self._decode_base64(data)
@@ -15,6 +25,31 @@ class Base64ImageField(serializers.ImageField):
         return isinstance(data, str) and data.startswith('data:image')
 
     def _decode_base64(self, data):
-        header, imgstr = data.split(';base64,')
-        ext = header.split('/')[-1]
-        return ContentFile(base64.b64decode(imgstr), name=f'temp.{ext}')
+        # Декодируем по частям сразу во временный файл, чтобы не держать
+        # в памяти ещё и полную копию картинки в байтах.
+        start = data.find(BASE64_MARKER)
+        if start == -1:
+            self.fail('invalid_image')
+        ext = data[:start].split('/')[-1]
+        upload = TemporaryUploadedFile(
+            f'temp.{ext}', f'image/{ext}', 0, None
+        )
+        tail = ''
+        try:
+            for offset in range(start + len(BASE64_MARKER), len(data),
+                                BASE64_DECODE_CHUNK_SIZE):
+                chunk = tail + WHITESPACE.sub(
+                    '', data[offset:offset + BASE64_DECODE_CHUNK_SIZE]
+                )
+                usable = len(chunk) - len(chunk) % 4
+                upload.write(base64.b64decode(chunk[:usable]))
+                tail = chunk[usable:]
+        except binascii.Error:
+            upload.close()
+            self.fail('invalid_image')
+        if tail:
+            upload.close()
+            self.fail('invalid_image')
+        upload.size = upload.tell()
+        upload.seek(0)
+        return upload
@@ -0,0 +1,116 @@
+import bisect
+import hashlib
+import threading
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.db.models import Count
+
+from recipes.cache import INGREDIENTS_VERSION, get_version
+from recipes.models import Ingredient
+
+MAX_CHAR = chr(0x10FFFF)
+
+
+def normalize(value):
+    """Case-folds a name for prefix search, treating «ё» as «е»."""
+    return value.casefold().replace('ё', 'е')
+
+
+# Одна неизменяемая сборка индекса.
+Snapshot = namedtuple(
+    'Snapshot',
+    ('keys', 'rows', 'digest', 'version', 'built_at', 'built_time_ns'),
+)
+
+
+class IngredientIndex:
+    """
+    Per-process prefix index over ingredient names for autocomplete.
+
+    The whole table is small and rarely changes, so it is kept in memory as
+    a sorted list of normalized names searched with bisect. Matches are
+    ranked by how many recipes use the ingredient. The index is rebuilt
+    when the shared ingredients version changes and, to keep the ranking
+    fresh, after `INGREDIENT_INDEX_TTL` seconds.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+
+    def build(self):
+        """
+        Builds a new snapshot and publishes it with one assignment, so a
+        reader never sees keys of one build with rows of another.
+        """
+        version = get_version(INGREDIENTS_VERSION)
+        ingredients = (
+            Ingredient.objects
+            .annotate(uses=Count('recipeingredient'))
+            .values('id', 'name', 'measurement_unit', 'uses')
+        )
+        entries = sorted(
+            (normalize(item['name']), item['name'], item) for item in
+            ingredients
+        )
+        rows = tuple(
+            (-item.pop('uses'), item['name'], item)
+            for _, _, item in entries
+        )
+        self._snapshot = Snapshot(
+            keys=tuple(key for key, _, _ in entries),
+            rows=rows,
+            digest=hashlib.md5(repr(rows).encode()).hexdigest(),
+            version=version,
+            built_at=time.monotonic(),
+            built_time_ns=time.time_ns(),
+        )
+
+    def _ensure_fresh(self):
+        """Returns the current snapshot, rebuilding it when stale."""
+        snapshot = self._snapshot
+        if snapshot is not None and (
+            time.monotonic() - snapshot.built_at
+            <= settings.INGREDIENT_INDEX_TTL
+            and snapshot.version == get_version(INGREDIENTS_VERSION)
+        ):
+            return snapshot
+        # Пока один поток перестраивает индекс, остальные отвечают по
+        # старому, а не ждут.
+        if self._lock.acquire(blocking=snapshot is None):
+            try:
+                self.build()
+            finally:
+                self._lock.release()
+        return self._snapshot
+
+    def state(self):
+        """
+        (digest, built_time_ns) of the current index. The digest covers the
+        popularity ranking too, so it is a validator for search results;
+        the build time serves as their modification date.
+        """
+        snapshot = self._ensure_fresh()
+        return snapshot.digest, snapshot.built_time_ns
+
+    def search(self, prefix='', limit=None):
+        """
+        Returns ingredients whose name starts with `prefix`, most used
+        first; without a prefix returns all of them ordered by name.
+        """
+        snapshot = self._ensure_fresh()
+        keys, rows = snapshot.keys, snapshot.rows
+        if not prefix:
+            found = [item for _, _, item in rows]
+        else:
+            prefix = normalize(prefix)
+            start = bisect.bisect_left(keys, prefix)
+            end = bisect.bisect_right(keys, prefix + MAX_CHAR, lo=start)
+            found = [item for _, _, item in sorted(rows[start:end],
+                                                   key=lambda row: row[:2])]
+        return found[:limit] if limit else found
+
+
+ingredient_index = IngredientIndex()
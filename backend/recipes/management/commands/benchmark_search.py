@@ -0,0 +1,74 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from recipes.models import Recipe
+
+DEFAULT_TERMS = (
+    'борщ', 'курица с картофелем', 'салат', 'пирог яблочный', 'суп',
+    'паста карбонара', 'блины', 'шоколадный торт', 'плов', 'омлет',
+    # Опечатка: полнотекстовый поиск ничего не находит.
+    'борш',
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет время полнотекстового поиска рецептов: первая страница '
+        'выдачи и подсчёт результатов для пагинации.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('terms', nargs='*', default=DEFAULT_TERMS)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--limit', type=int,
+                            default=settings.RECIPES_PER_PAGE)
+        parser.add_argument('--budget-ms', type=float, default=50.0)
+        parser.add_argument(
+            '--explain', action='store_true',
+            help='Вывести EXPLAIN ANALYZE для первого запроса каждого терма.'
+        )
+
+    def _time(self, func, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - start) * 1000)
+        return timings
+
+    def handle(self, *args, terms, repeat, limit, budget_ms, explain,
+               **options):
+        self.stdout.write(f'Рецептов в базе: {Recipe.objects.count()}')
+        worst = 0
+        for term in terms:
+            if explain:
+                self.stdout.write(
+                    Recipe.objects.search(term)[:limit].explain(analyze=True)
+                )
+            # search() сразу выбирает кандидатов, это тоже входит в замер.
+            page = self._time(
+                lambda: list(Recipe.objects.search(term).values_list(
+                    'id', flat=True
+                )[:limit]),
+                repeat,
+            )
+            count = self._time(
+                lambda: Recipe.objects.search(term).count(), repeat
+            )
+            for label, timings in (('page', page), ('count', count)):
+                p95 = statistics.quantiles(timings, n=20)[-1]
+                worst = max(worst, p95)
+                self.stdout.write(
+                    f'{term!r:28} {label:5} '
+                    f'p50={statistics.median(timings):7.2f}ms '
+                    f'p95={p95:7.2f}ms max={max(timings):7.2f}ms'
+                )
+        style = self.style.SUCCESS if worst <= budget_ms else self.style.ERROR
+        self.stdout.write(style(
+            f'Худший p95: {worst:.2f}ms (бюджет {budget_ms}ms, '
+            f'{connection.vendor})'
+        ))
@@ -0,0 +1,107 @@
+import base64
+import json
+import sys
+
+from django.core.management.base import BaseCommand
+from django.db.models import Prefetch
+
+from recipes.models import Recipe, RecipeIngredient
+
+
+class Command(BaseCommand):
+    help = (
+        'Выгружает рецепты в NDJSON: одна строка — один рецепт с автором, '
+        'тегами, ингредиентами и картинкой. Память не растёт с числом '
+        'рецептов.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output', default='-',
+            help='Файл для выгрузки, по умолчанию stdout.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Сколько рецептов читать из базы за раз.',
+        )
+        parser.add_argument(
+            '--no-images', action='store_true',
+            help='Не включать картинки в выгрузку.',
+        )
+
+    def handle(self, *args, **options):
+        output = (
+            sys.stdout if options['output'] == '-'
+            else open(options['output'], 'w', encoding='utf-8')
+        )
+        exported = 0
+        try:
+            for recipe in self._recipes(options['batch_size']):
+                output.write(json.dumps(
+                    self._serialize(recipe, not options['no_images']),
+                    ensure_ascii=False,
+                ))
+                output.write('\n')
+                exported += 1
+        finally:
+            if output is not sys.stdout:
+                output.close()
+        self.stderr.write(f'Выгружено рецептов: {exported}')
+
+    @staticmethod
+    def _recipes(batch_size):
+        """Keyset batches: every batch costs the same however deep it is."""
+        last_id = 0
+        while True:
+            batch = list(
+                Recipe.objects.filter(pk__gt=last_id)
+                .order_by('pk')
+                .select_related('author')
+                .prefetch_related(
+                    'tags',
+                    Prefetch(
+                        'recipe_ingredients',
+                        queryset=RecipeIngredient.objects.select_related(
+                            'ingredient'
+                        ),
+                    ),
+                )[:batch_size]
+            )
+            if not batch:
+                return
+            yield from batch
+            last_id = batch[-1].pk
+
+    @staticmethod
+    def _serialize(recipe, with_image):
+        author = recipe.author
+        data = {
+            'id': recipe.pk,
+            'author': {
+                'email': author.email,
+                'username': author.username,
+                'first_name': author.first_name,
+                'last_name': author.last_name,
+            },
+            'name': recipe.name,
+            'text': recipe.text,
+            'cooking_time': recipe.cooking_time,
+            'pub_date': recipe.pub_date.isoformat(),
+            'tags': [tag.slug for tag in recipe.tags.all()],
+            'ingredients': [
+                {
+                    'name': item.ingredient.name,
+                    'measurement_unit': item.ingredient.measurement_unit,
+                    'amount': item.amount,
+                }
+                for item in recipe.recipe_ingredients.all()
+            ],
+            'image': None,
+        }
+        if with_image and recipe.image:
+            with recipe.image.open('rb') as file:
+                data['image'] = {
+                    'name': recipe.image.name.rsplit('/', 1)[-1],
+                    'data': base64.b64encode(file.read()).decode(),
+                }
+        return data
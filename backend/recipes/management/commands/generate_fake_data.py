@@ -0,0 +1,223 @@
+import io
+import random
+from datetime import timedelta
+from itertools import accumulate
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image
+
+from recipes.cache import RECIPES_VERSION, bump_versions
+from recipes.models import (
+    Favourites,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    ShoppingList,
+    Tag,
+)
+from users.models import Follow
+
+User = get_user_model()
+
+WORDS = (
+    'суп', 'салат', 'пирог', 'курица', 'борщ', 'каша', 'омлет', 'паста',
+    'рагу', 'запеканка', 'блины', 'котлеты', 'плов', 'торт', 'соус',
+    'домашний', 'быстрый', 'острый', 'сливочный', 'овощной', 'яблочный',
+    'с грибами', 'с сыром', 'по-деревенски', 'на скорую руку',
+)
+
+
+class Zipf:
+    """
+    Picks items with a skewed, Zipf-like distribution: the item at rank
+    `r` is chosen with weight 1 / (r + 1) ** skew, so a few popular items
+    get most of the picks, as in real traffic.
+    """
+
+    def __init__(self, items, skew, rng):
+        self.items = list(items)
+        self.rng = rng
+        self.cum_weights = list(accumulate(
+            1 / (rank + 1) ** skew for rank in range(len(self.items))
+        ))
+
+    def pick(self):
+        return self.rng.choices(self.items, cum_weights=self.cum_weights)[0]
+
+    def sample(self, k):
+        """Up to `k` distinct items."""
+        k = min(k, len(self.items))
+        picked = set()
+        for _ in range(k * 3):
+            picked.add(self.pick())
+            if len(picked) == k:
+                break
+        return picked
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет базу синтетическими данными для нагрузочных замеров: '
+        'пользователи, подписки, рецепты с ингредиентами из справочника, '
+        'избранное и корзины с неравномерным (Zipf) распределением. '
+        'У каждого рецепта свой файл картинки, чтобы удаление рецепта не '
+        'задевало чужие. В конце пересчитывает счётчики.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10_000)
+        parser.add_argument('--follows', type=int, default=20,
+                            help='Среднее число подписок пользователя.')
+        parser.add_argument('--favorites', type=int, default=30,
+                            help='Среднее число рецептов в избранном.')
+        parser.add_argument('--cart', type=int, default=5,
+                            help='Среднее число рецептов в корзине.')
+        parser.add_argument('--skew', type=float, default=1.1,
+                            help='Показатель Zipf, больше — неравномернее.')
+        parser.add_argument('--prefix', default='bench',
+                            help='Префикс имён и email пользователей.')
+        parser.add_argument('--password', default='bench-password')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        prefix = options['prefix']
+        if User.objects.filter(username__startswith=prefix).exists():
+            raise CommandError(
+                f'Пользователи с префиксом {prefix!r} уже есть, '
+                'укажите другой --prefix.'
+            )
+        if not Ingredient.objects.exists() or not Tag.objects.exists():
+            call_command('import_catalog')
+        ingredients = list(Ingredient.objects.values_list('id', flat=True))
+        tags = list(Tag.objects.values_list('id', flat=True))
+        # Какие ингредиенты окажутся «популярными», решает перестановка,
+        # воспроизводимая при том же --seed.
+        rng.shuffle(ingredients)
+
+        users = self._create_users(options['users'], prefix,
+                                   options['password'])
+        self.stdout.write(f'Пользователей: {len(users)}')
+        popular_users = Zipf(users, options['skew'], rng)
+
+        follows = self._create_relations(
+            Follow, 'user_id', 'following_id', users, popular_users,
+            options['follows'], rng,
+        )
+        self.stdout.write(f'Подписок: {follows}')
+
+        recipes = self._create_recipes(
+            options['recipes'], popular_users,
+            Zipf(ingredients, options['skew'], rng), tags, rng, prefix,
+        )
+        self.stdout.write(f'Рецептов: {len(recipes)}')
+        popular_recipes = Zipf(recipes, options['skew'], rng)
+        for model, mean in ((Favourites, options['favorites']),
+                            (ShoppingList, options['cart'])):
+            created = self._create_relations(
+                model, 'user_id', 'recipe_id', users, popular_recipes,
+                mean, rng,
+            )
+            self.stdout.write(
+                f'{model._meta.verbose_name_plural}: {created}'
+            )
+
+        # Всё выше вставлялось в обход сигналов.
+        call_command('recount_counters', stdout=self.stdout)
+        bump_versions(RECIPES_VERSION)
+        self.stdout.write(self.style.SUCCESS('Данные сгенерированы.'))
+
+    def _create_users(self, count, prefix, password):
+        password = make_password(password)
+        User.objects.bulk_create(
+            (
+                User(
+                    username=f'{prefix}{i}',
+                    email=f'{prefix}{i}@example.com',
+                    first_name='Тест',
+                    last_name=f'Пользователь {i}',
+                    password=password,
+                )
+                for i in range(count)
+            ),
+            batch_size=self.batch_size,
+        )
+        return list(
+            User.objects.filter(username__startswith=prefix)
+            .order_by('id').values_list('id', flat=True)
+        )
+
+    def _create_relations(self, model, owner_field, target_field, owners,
+                          targets, mean, rng):
+        rows = []
+        for owner in owners:
+            for target in targets.sample(rng.randint(0, 2 * mean)):
+                if target != owner:
+                    rows.append(model(**{owner_field: owner,
+                                         target_field: target}))
+        model.objects.bulk_create(rows, batch_size=self.batch_size)
+        return len(rows)
+
+    def _create_recipes(self, count, authors, ingredients, tags, rng,
+                        prefix):
+        image = self._render_image()
+        now = timezone.now()
+        max_tags = min(3, len(tags))
+        ids = []
+        for start in range(0, count, self.batch_size):
+            size = min(self.batch_size, count - start)
+            with transaction.atomic():
+                objs = Recipe.objects.bulk_create([
+                    Recipe(
+                        author_id=authors.pick(),
+                        name=' '.join(rng.sample(WORDS, 2)).capitalize(),
+                        text=' '.join(rng.choices(WORDS, k=40)),
+                        cooking_time=rng.randint(5, 180),
+                        image=self._save_image(
+                            image, f'{prefix}-{start + i}.png'
+                        ),
+                    )
+                    for i in range(size)
+                ])
+                # auto_now_add не даёт задать дату при вставке.
+                for obj in objs:
+                    obj.pub_date = now - timedelta(
+                        minutes=rng.randint(0, 365 * 24 * 60)
+                    )
+                Recipe.objects.bulk_update(objs, ['pub_date'])
+                Recipe.tags.through.objects.bulk_create([
+                    Recipe.tags.through(recipe_id=obj.pk, tag_id=tag)
+                    for obj in objs
+                    for tag in rng.sample(tags, rng.randint(1, max_tags))
+                ])
+                RecipeIngredient.objects.bulk_create([
+                    RecipeIngredient(recipe_id=obj.pk, ingredient_id=item,
+                                     amount=rng.randint(1, 500))
+                    for obj in objs
+                    for item in ingredients.sample(rng.randint(3, 10))
+                ])
+            ids.extend(obj.pk for obj in objs)
+        return ids
+
+    @staticmethod
+    def _render_image():
+        buffer = io.BytesIO()
+        Image.new('RGB', (64, 64), (200, 120, 40)).save(buffer, 'PNG')
+        return buffer.getvalue()
+
+    @staticmethod
+    def _save_image(content, filename):
+        # Удаление рецепта удаляет и его файл, общий файл пропал бы у всех.
+        field = Recipe._meta.get_field('image')
+        return field.storage.save(
+            field.generate_filename(None, filename), ContentFile(content),
+        )
@@ -0,0 +1,179 @@
+import csv
+import os
+from itertools import islice
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from recipes.cache import (
+    INGREDIENTS_VERSION,
+    RECIPES_VERSION,
+    TAGS_VERSION,
+    bump_versions_on_commit,
+)
+from recipes.models import Ingredient, Tag
+
+DATA_DIR = os.path.join(
+    settings.BASE_DIR, 'recipes', 'scripts', 'csv_data'
+)
+
+# Для каждого справочника: модель, разделитель в CSV, колонки, ключ для
+# сопоставления с уже загруженными строками и версии кэша, которые
+# нужно сбросить после изменений.
+CATALOGS = {
+    'ingredients': (
+        Ingredient, ',', ('name', 'measurement_unit'), 'name',
+        (INGREDIENTS_VERSION, RECIPES_VERSION),
+    ),
+    'tags': (
+        Tag, ';', ('name', 'slug'), 'slug',
+        (TAGS_VERSION, RECIPES_VERSION),
+    ),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Загружает ингредиенты и теги из CSV без удаления существующих: '
+        'новые строки добавляются, изменённые обновляются, id и ссылки '
+        'из рецептов сохраняются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--ingredients',
+            default=os.path.join(DATA_DIR, 'ingredients.csv'),
+            help='CSV «название,единица измерения» без заголовка.',
+        )
+        parser.add_argument(
+            '--tags',
+            default=os.path.join(DATA_DIR, 'tags.csv'),
+            help='CSV «название;slug» без заголовка.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=5000,
+            help='Размер пачки, если база не PostgreSQL.',
+        )
+
+    def handle(self, *args, **options):
+        for catalog in CATALOGS:
+            path = options[catalog]
+            if not os.path.exists(path):
+                self.stdout.write(f'Файл не найден: {path}')
+                continue
+            model, delimiter, columns, key, versions = CATALOGS[catalog]
+            with open(path, encoding='utf-8', newline='') as file:
+                with transaction.atomic():
+                    if connection.vendor == 'postgresql':
+                        counts = self._copy_upsert(
+                            file, model, delimiter, columns, key
+                        )
+                    else:
+                        counts = self._batch_upsert(
+                            file, model, delimiter, columns, key,
+                            options['batch_size'],
+                        )
+                    if counts[0] or counts[1]:
+                        bump_versions_on_commit(*versions)
+            inserted, updated, unchanged = counts
+            self.stdout.write(self.style.SUCCESS(
+                f'{catalog}: добавлено {inserted}, обновлено {updated}, '
+                f'без изменений {unchanged}'
+            ))
+
+    @staticmethod
+    def _copy_upsert(file, model, delimiter, columns, key):
+        """
+        Streams the file into a temporary table with COPY and merges it in
+        one statement; Python never holds more than the copy buffer.
+        """
+        table = model._meta.db_table
+        staging = f'{table}_staging'
+        column_list = ', '.join(columns)
+        values = [
+            f"NULLIF(TRIM({column}), '') AS {column}" for column in columns
+        ]
+        updated_columns = [column for column in columns if column != key]
+        assignments = ', '.join(
+            f'{column} = EXCLUDED.{column}' for column in updated_columns
+        )
+        changed = ' OR '.join(
+            f'{table}.{column} IS DISTINCT FROM EXCLUDED.{column}'
+            for column in updated_columns
+        )
+        not_null = ' AND '.join(f'{column} IS NOT NULL' for column in columns)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE TEMP TABLE {staging} '
+                f'({", ".join(f"{column} text" for column in columns)}) '
+                f'ON COMMIT DROP'
+            )
+            cursor.copy_expert(
+                f'COPY {staging} ({column_list}) FROM STDIN '
+                f"WITH (FORMAT csv, DELIMITER '{delimiter}')",
+                file,
+            )
+            # В файле ключ может повторяться: берём последнее вхождение,
+            # как и при построчной загрузке.
+            cursor.execute(
+                f'WITH numbered AS ('
+                f'  SELECT {", ".join(values)}, '
+                f'  ROW_NUMBER() OVER () AS line FROM {staging}'
+                f'), source AS ('
+                f'  SELECT DISTINCT ON ({key}) {column_list} FROM numbered '
+                f'  WHERE {not_null}'
+                f'  ORDER BY {key}, line DESC'
+                f'), merged AS ('
+                f'  INSERT INTO {table} ({column_list}) '
+                f'  SELECT {column_list} FROM source '
+                f'  ON CONFLICT ({key}) DO UPDATE SET '
+                f'  {assignments} '
+                f'  WHERE {changed} '
+                f'  RETURNING (xmax = 0) AS inserted'
+                f') '
+                f'SELECT '
+                f'  (SELECT COUNT(*) FROM merged WHERE inserted), '
+                f'  (SELECT COUNT(*) FROM merged WHERE NOT inserted), '
+                f'  (SELECT COUNT(*) FROM source)'
+            )
+            inserted, updated, total = cursor.fetchone()
+        return inserted, updated, total - inserted - updated
+
+    @staticmethod
+    def _batch_upsert(file, model, delimiter, columns, key, batch_size):
+        """Portable fallback: reads and merges the file batch by batch."""
+        rows = (
+            dict(zip(columns, (value.strip() for value in row)))
+            for row in csv.reader(file, delimiter=delimiter)
+        )
+        rows = (
+            row for row in rows
+            if len(row) == len(columns) and all(row.values())
+        )
+        inserted = updated = unchanged = 0
+        while True:
+            batch = {
+                row[key]: row for row in islice(rows, batch_size)
+            }
+            if not batch:
+                break
+            existing = model.objects.in_bulk(list(batch), field_name=key)
+            created, changed = [], []
+            for value, row in batch.items():
+                obj = existing.get(value)
+                if obj is None:
+                    created.append(model(**row))
+                elif any(getattr(obj, c) != row[c] for c in columns):
+                    for column in columns:
+                        setattr(obj, column, row[column])
+                    changed.append(obj)
+                else:
+                    unchanged += 1
+            model.objects.bulk_create(created)
+            model.objects.bulk_update(
+                changed, [c for c in columns if c != key]
+            )
+            inserted += len(created)
+            updated += len(changed)
+        return inserted, updated, unchanged
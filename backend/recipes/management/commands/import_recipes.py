@@ -0,0 +1,201 @@
+import base64
+import json
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from multiprocessing import get_context
+
+import django
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils.dateparse import parse_datetime
+
+from recipes.cache import RECIPES_VERSION, bump_versions_on_commit
+from recipes.counters import increment_many
+from recipes.models import (
+    ImportProgress,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    Tag,
+)
+
+User = get_user_model()
+
+
+def _store_image(image):
+    """Runs in a worker process: decodes one image and writes it."""
+    if not image:
+        return ''
+    field = Recipe._meta.get_field('image')
+    return field.storage.save(
+        field.generate_filename(None, image['name']),
+        ContentFile(base64.b64decode(image['data'])),
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        'Загружает рецепты из NDJSON, созданного export_recipes. Теги '
+        'ищутся по slug, ингредиенты по названию, авторы по email '
+        '(недостающие создаются без пароля). Позиция в файле хранится в '
+        'базе вместе с каждой пачкой, поэтому после сбоя повторный запуск '
+        'продолжает ровно с первой незагруженной.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', help='Файл NDJSON.')
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Сколько рецептов сохранять в одной транзакции.',
+        )
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count(),
+            help='Процессов для декодирования и записи картинок.',
+        )
+        parser.add_argument(
+            '--source',
+            help='Под каким именем хранить позицию продолжения, по '
+                 'умолчанию абсолютный путь к файлу.',
+        )
+
+    def handle(self, *args, **options):
+        path = options['input']
+        progress, _ = ImportProgress.objects.get_or_create(
+            source=options['source'] or os.path.abspath(path)
+        )
+        offset = progress.offset
+        if offset:
+            self.stdout.write(f'Продолжаю с позиции {offset}.')
+        imported = skipped = 0
+        # Воркеры запускаются через spawn, а не fork: пул создаёт их при
+        # первой задаче, когда у родителя уже открыто соединение с базой,
+        # и форкнутый процесс унаследовал бы его сокет.
+        with ProcessPoolExecutor(
+            options['workers'], mp_context=get_context('spawn'),
+            initializer=django.setup,
+        ) as pool, open(path, 'rb') as file:
+            file.seek(offset)
+            while True:
+                lines = list(islice(file, options['batch_size']))
+                if not lines:
+                    break
+                recipes = [json.loads(line) for line in lines if line.strip()]
+                done, missing = self._import_batch(
+                    recipes, pool, progress, file.tell()
+                )
+                imported += done
+                skipped += len(missing)
+                for source_id, reason in missing:
+                    self.stderr.write(f'Рецепт {source_id} пропущен: {reason}')
+                self.stdout.write(f'Загружено рецептов: {imported}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово: загружено {imported}, пропущено {skipped}.'
+        ))
+
+    @staticmethod
+    def _save_progress(progress, offset):
+        progress.offset = offset
+        progress.save(update_fields=['offset', 'updated_at'])
+
+    def _import_batch(self, recipes, pool, progress, offset):
+        """
+        Saves the valid recipes of a batch and moves `progress` to `offset`
+        in one transaction.
+        """
+        tags = Tag.objects.in_bulk(
+            {slug for recipe in recipes for slug in recipe['tags']},
+            field_name='slug',
+        )
+        ingredients = Ingredient.objects.in_bulk(
+            {item['name'] for recipe in recipes
+             for item in recipe['ingredients']},
+            field_name='name',
+        )
+        missing, valid = [], []
+        for recipe in recipes:
+            unknown = (
+                [slug for slug in recipe['tags'] if slug not in tags]
+                + [item['name'] for item in recipe['ingredients']
+                   if item['name'] not in ingredients]
+            )
+            if unknown:
+                missing.append((
+                    recipe.get('id'), f'нет в базе: {", ".join(unknown)}'
+                ))
+            else:
+                valid.append(recipe)
+        if not valid:
+            self._save_progress(progress, offset)
+            return 0, missing
+        # Картинки пишутся в хранилище до транзакции: если она упадёт,
+        # останутся лишние файлы, но не рецепты без картинок.
+        images = list(pool.map(
+            _store_image, (recipe['image'] for recipe in valid)
+        ))
+
+        with transaction.atomic():
+            # Авторы создаются в той же транзакции: после сбоя пачки не
+            # остаётся пользователей без её рецептов.
+            authors = self._get_authors(
+                recipe['author'] for recipe in valid
+            )
+            objs = Recipe.objects.bulk_create([
+                Recipe(
+                    author=authors[recipe['author']['email']],
+                    name=recipe['name'],
+                    text=recipe['text'],
+                    cooking_time=recipe['cooking_time'],
+                    image=image,
+                )
+                for recipe, image in zip(valid, images)
+            ])
+            # auto_now_add перезаписывает дату при вставке, возвращаем
+            # исходную отдельным запросом.
+            for obj, recipe in zip(objs, valid):
+                obj.pub_date = parse_datetime(recipe['pub_date'])
+            Recipe.objects.bulk_update(objs, ['pub_date'])
+            Recipe.tags.through.objects.bulk_create([
+                Recipe.tags.through(recipe_id=obj.pk, tag_id=tags[slug].pk)
+                for obj, recipe in zip(objs, valid)
+                for slug in recipe['tags']
+            ])
+            RecipeIngredient.objects.bulk_create([
+                RecipeIngredient(
+                    recipe_id=obj.pk,
+                    ingredient_id=ingredients[item['name']].pk,
+                    amount=item['amount'],
+                )
+                for obj, recipe in zip(objs, valid)
+                for item in recipe['ingredients']
+            ])
+            increment_many(
+                User.objects.all(), 'recipes_count',
+                Counter(obj.author_id for obj in objs),
+            )
+            bump_versions_on_commit(RECIPES_VERSION)
+            self._save_progress(progress, offset)
+        return len(objs), missing
+
+    @staticmethod
+    def _get_authors(authors):
+        authors = {author['email']: author for author in authors}
+        found = User.objects.in_bulk(list(authors), field_name='email')
+        new = [
+            User(
+                email=email,
+                username=author['username'],
+                first_name=author['first_name'],
+                last_name=author['last_name'],
+                password=make_password(None),
+            )
+            for email, author in authors.items() if email not in found
+        ]
+        if new:
+            User.objects.bulk_create(new)
+            found = User.objects.in_bulk(list(authors), field_name='email')
+        return found
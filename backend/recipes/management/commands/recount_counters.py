@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.counters import recount_all
+from recipes.shopping_list import rebuild_totals
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает счётчики избранного, рецептов и подписчиков '
+        'и итоги списков покупок, исправляя расхождения.'
+    )
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        for field, fixed in recount_all().items():
+            self.stdout.write(f'{field}: исправлено строк — {fixed}')
+        rebuild_totals()
+        self.stdout.write(self.style.SUCCESS('Счётчики пересчитаны.'))
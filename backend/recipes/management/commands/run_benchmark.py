@@ -0,0 +1,208 @@
+import json
+import statistics
+import subprocess
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from recipes.models import Ingredient, Recipe, ShoppingList, Tag
+from users.models import User
+
+PERCENTILES = (50, 90, 95, 99)
+
+
+class Command(BaseCommand):
+    help = (
+        'Прогоняет основные эндпоинты API через тестовый клиент Django и '
+        'пишет перцентили задержки и число SQL-запросов в JSON-отчёт, '
+        'чтобы сравнивать прогоны между коммитами (--baseline).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument(
+            '--user',
+            help='Email пользователя для авторизованных запросов, по '
+                 'умолчанию — тот, у кого больше всего рецептов в корзине.',
+        )
+        parser.add_argument(
+            '--host',
+            help='Заголовок Host запросов, по умолчанию первый из '
+                 'ALLOWED_HOSTS или localhost.',
+        )
+        parser.add_argument('--only', nargs='*',
+                            help='Запустить только эти сценарии.')
+        parser.add_argument('--output', help='Куда записать JSON-отчёт.')
+        parser.add_argument('--baseline',
+                            help='Отчёт прошлого прогона для сравнения.')
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 2:
+            raise CommandError('--repeat должен быть не меньше 2.')
+        user = self._get_user(options['user'])
+        token, _ = Token.objects.get_or_create(user=user)
+        host = options['host'] or self._default_host()
+        anon = Client(SERVER_NAME=host)
+        auth = Client(SERVER_NAME=host,
+                      HTTP_AUTHORIZATION=f'Token {token.key}')
+
+        results = {}
+        for name, client, paths in self._scenarios(anon, auth):
+            if options['only'] and name not in options['only']:
+                continue
+            results[name] = self._run(client, paths, options['warmup'],
+                                      options['repeat'])
+            self._print(name, results[name])
+
+        report = {
+            'meta': {
+                'revision': self._revision(),
+                'created': timezone.now().isoformat(),
+                'database': connection.vendor,
+                'debug': settings.DEBUG,
+                'repeat': options['repeat'],
+                'users': User.objects.count(),
+                'recipes': Recipe.objects.count(),
+            },
+            'scenarios': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+            self.stdout.write(f'Отчёт записан в {options["output"]}')
+        if options['baseline']:
+            self._compare(options['baseline'], results)
+
+    @staticmethod
+    def _default_host():
+        # Пустой ALLOWED_HOSTS в режиме DEBUG разрешает localhost.
+        hosts = [host.lstrip('.') for host in settings.ALLOWED_HOSTS]
+        return next(
+            (host for host in hosts if host and host != '*'), 'localhost'
+        )
+
+    @staticmethod
+    def _get_user(email):
+        if email:
+            user = User.objects.filter(email=email).first()
+        else:
+            top = (
+                ShoppingList.objects.values('user')
+                .annotate(total=Count('id')).order_by('-total').first()
+            )
+            user = (User.objects.filter(pk=top['user']).first()
+                    if top else User.objects.order_by('id').first())
+        if user is None:
+            raise CommandError(
+                'Нет пользователя для замеров, сначала запустите '
+                'generate_fake_data.'
+            )
+        return user
+
+    @staticmethod
+    def _scenarios(anon, auth):
+        """(name, client, paths): paths are requested in turn."""
+        recipe_ids = list(
+            Recipe.objects.order_by('?').values_list('id', flat=True)[:50]
+        )
+        top_author = (
+            User.objects.order_by('-recipes_count')
+            .values_list('id', flat=True).first()
+        )
+        slugs = list(Tag.objects.values_list('slug', flat=True)[:2])
+        names = Ingredient.objects.order_by('?').values_list(
+            'name', flat=True
+        )[:20]
+        prefixes = sorted({name[:3].lower() for name in names})
+        tags = '&'.join(f'tags={slug}' for slug in slugs)
+        scenarios = [
+            ('recipes_list', auth, ['/api/recipes/']),
+            ('recipes_list_anonymous', anon, ['/api/recipes/']),
+            ('recipes_cursor', auth, ['/api/recipes/?cursor=']),
+            ('recipes_by_tags', auth,
+             [f'/api/recipes/?{tags}']),
+            ('recipes_by_author', auth,
+             [f'/api/recipes/?author={top_author}']),
+            ('recipes_favorited', auth, ['/api/recipes/?is_favorited=1']),
+            ('recipes_in_cart', auth,
+             ['/api/recipes/?is_in_shopping_cart=1']),
+            ('recipe_detail', auth,
+             [f'/api/recipes/{pk}/' for pk in recipe_ids]),
+            ('subscriptions', auth,
+             ['/api/users/subscriptions/?recipes_limit=3']),
+            ('download_shopping_cart', auth,
+             ['/api/recipes/download_shopping_cart/?format=txt']),
+            ('ingredient_search', anon,
+             [f'/api/ingredients/?name={prefix}' for prefix in prefixes]),
+        ]
+        # Полнотекстовый поиск есть только в Postgres.
+        if connection.vendor == 'postgresql':
+            scenarios.append(('recipes_search', auth, [
+                '/api/recipes/?search=суп', '/api/recipes/?search=пирог',
+            ]))
+        return scenarios
+
+    @staticmethod
+    def _run(client, paths, warmup, repeat):
+        for i in range(warmup):
+            client.get(paths[i % len(paths)])
+        timings, queries, statuses = [], [], set()
+        for i in range(repeat):
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                response = client.get(paths[i % len(paths)])
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                timings.append((time.perf_counter() - start) * 1000)
+            queries.append(len(captured))
+            statuses.add(response.status_code)
+        cuts = statistics.quantiles(timings, n=100)
+        return {
+            **{f'p{p}_ms': round(cuts[p - 1], 3) for p in PERCENTILES},
+            'mean_ms': round(statistics.fmean(timings), 3),
+            'max_ms': round(max(timings), 3),
+            'queries': statistics.median(queries),
+            'queries_max': max(queries),
+            'statuses': sorted(statuses),
+        }
+
+    def _print(self, name, result):
+        self.stdout.write(
+            f'{name:26} p50={result["p50_ms"]:8.2f}ms '
+            f'p95={result["p95_ms"]:8.2f}ms p99={result["p99_ms"]:8.2f}ms '
+            f'queries={result["queries"]:g} statuses={result["statuses"]}'
+        )
+
+    def _compare(self, path, results):
+        with open(path, encoding='utf-8') as file:
+            baseline = json.load(file)['scenarios']
+        self.stdout.write(f'Сравнение с {path}:')
+        for name, result in results.items():
+            before = baseline.get(name)
+            if before is None:
+                continue
+            change = (result['p95_ms'] / before['p95_ms'] - 1) * 100
+            style = self.style.ERROR if change > 10 else self.style.SUCCESS
+            self.stdout.write(style(
+                f'{name:26} p95 {before["p95_ms"]:8.2f} → '
+                f'{result["p95_ms"]:8.2f}ms ({change:+.0f}%), '
+                f'queries {before["queries"]:g} → {result["queries"]:g}'
+            ))
+
+    @staticmethod
+    def _revision():
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'],
+                capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
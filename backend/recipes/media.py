@@ -0,0 +1,86 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+_pending = []
+_lock = threading.Lock()
+_executor = ThreadPoolExecutor(
+    max_workers=1, thread_name_prefix='media-cleanup'
+)
+
+
+def _loaded_name(instance, field):
+    """
+    Name of the file currently set on the instance, or None if the field
+    is deferred: reading it would cost a query.
+    """
+    if field not in instance.__dict__:
+        return None
+    value = instance.__dict__[field]
+    return getattr(value, 'name', value) or ''
+
+
+def remember_files(instance, fields):
+    """Stores the file names the instance was loaded or saved with."""
+    instance._original_files = {
+        field: _loaded_name(instance, field) for field in fields
+    }
+
+
+def delete_replaced_files(instance, fields, update_fields=None):
+    """
+    Schedules deletion of files replaced by the save that just happened.
+    The original names were remembered on load, so nothing is re-fetched.
+    """
+    original = getattr(instance, '_original_files', {})
+    for field in fields:
+        if update_fields is not None and field not in update_fields:
+            continue
+        old = original.get(field)
+        if old and old != _loaded_name(instance, field):
+            schedule_delete(getattr(instance, field).storage, old)
+    remember_files(instance, fields)
+
+
+def delete_files(instance, fields):
+    for field in fields:
+        file = getattr(instance, field)
+        if file:
+            schedule_delete(file.storage, file.name)
+
+
+def schedule_delete(storage, name):
+    """
+    Deletes the file once the transaction commits: after a rollback the row
+    still points to it. Deletions are collected and removed in batches by a
+    background thread, off the request path.
+    """
+    transaction.on_commit(lambda: _enqueue(storage, name))
+
+
+def _enqueue(storage, name):
+    with _lock:
+        _pending.append((storage, name))
+        start = len(_pending) == 1
+    if start:
+        _executor.submit(_flush)
+
+
+def _flush():
+    # Небольшая пауза, чтобы удаления из соседних запросов попали
+    # в один проход.
+    time.sleep(settings.MEDIA_CLEANUP_DELAY)
+    with _lock:
+        batch = _pending[:]
+        _pending.clear()
+    for storage, name in batch:
+        try:
+            storage.delete(name)
+        except Exception:
+            logger.exception('Не удалось удалить файл %s', name)
@@ -0,0 +1,74 @@
+# Generated by Django 5.2.4 on 2026-10-17 06:49
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def remove_duplicates(apps, schema_editor):
+    # Ограничение из абстрактной модели не попадало в таблицы, поэтому
+    # дубли могли накопиться: оставляем самую раннюю запись и
+    # пересчитываем зависящие от них счётчики и суммы корзины.
+    Recipe = apps.get_model('recipes', 'Recipe')
+    RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+    ShoppingListItem = apps.get_model('recipes', 'ShoppingListItem')
+    for name in ('Favourites', 'ShoppingList'):
+        model = apps.get_model('recipes', name)
+        keep = (
+            model.objects.values('user', 'recipe')
+            .annotate(first=Min('id'))
+            .values('first')
+        )
+        model.objects.exclude(id__in=keep).delete()
+
+    Favourites = apps.get_model('recipes', 'Favourites')
+    Recipe.objects.update(favourites_count=Coalesce(
+        Subquery(
+            Favourites.objects.filter(recipe=OuterRef('pk'))
+            .order_by()
+            .values('recipe')
+            .annotate(total=Count('pk'))
+            .values('total')
+        ),
+        Value(0),
+    ))
+    ShoppingListItem.objects.all().delete()
+    totals = (
+        RecipeIngredient.objects
+        .filter(recipe__shoppinglist__isnull=False)
+        .values('recipe__shoppinglist__user', 'ingredient')
+        .annotate(total=Sum('amount'))
+        .order_by()
+    )
+    ShoppingListItem.objects.bulk_create(
+        (
+            ShoppingListItem(
+                user_id=row['recipe__shoppinglist__user'],
+                ingredient_id=row['ingredient'],
+                total=row['total'],
+            )
+            for row in totals.iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_recipe_search_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='favourites',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_recipes_favourites_user_recipe'),
+        ),
+        migrations.AddConstraint(
+            model_name='shoppinglist',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_recipes_shoppinglist_user_recipe'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.4 on 2026-10-17 07:26
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.conf import settings
+from django.contrib.postgres.operations import (
+    AddIndexConcurrently,
+    RemoveIndexConcurrently,
+)
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CONCURRENTLY здесь только у индексов. ADD COLUMN ... STORED
+    # переписывает всю таблицу рецептов под ACCESS EXCLUSIVE: чтение и
+    # запись рецептов стоят до конца перезаписи (около 100 с на 1M
+    # рецептов и одном ядре), поэтому миграцию нужно применять в окно
+    # обслуживания. Старый индекс по выражению удаляется последним, чтобы
+    # поиск не оставался без индекса.
+    atomic = False
+
+    dependencies = [
+        ('recipes', '0007_unique_user_recipe'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=models.GeneratedField(db_persist=True, expression=django.contrib.postgres.search.CombinedSearchVector(django.contrib.postgres.search.SearchVector('name', config='russian', weight='A'), '||', django.contrib.postgres.search.SearchVector('text', config='russian', weight='B'), django.contrib.postgres.search.SearchConfig('russian')), output_field=django.contrib.postgres.search.SearchVectorField()),
+        ),
+        AddIndexConcurrently(
+            model_name='recipe',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='recipe_search_vector_gin_idx'),
+        ),
+        RemoveIndexConcurrently(
+            model_name='recipe',
+            name='recipe_search_vector_idx',
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.4 on 2026-10-17 08:31
+
+import django.contrib.postgres.indexes
+from django.conf import settings
+from django.contrib.postgres.operations import (
+    AddIndexConcurrently,
+    RemoveIndexConcurrently,
+)
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    # Как в 0008: новый индекс строится CONCURRENTLY, старый удаляется
+    # после него.
+    atomic = False
+
+    dependencies = [
+        ('recipes', '0009_importprogress'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='recipe',
+            index=django.contrib.postgres.indexes.GistIndex(django.contrib.postgres.indexes.OpClass('name', name='gist_trgm_ops(siglen=64)'), name='recipe_name_trgm_gist_idx'),
+        ),
+        RemoveIndexConcurrently(
+            model_name='recipe',
+            name='recipe_name_trgm_idx',
+        ),
+    ]
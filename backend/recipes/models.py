@@ -1,47 +1,147 @@
-from datetime import datetime
 
 from django.conf import settings
-from django.core.exceptions import ValidationError
+from django.contrib.postgres.indexes import GinIndex, GistIndex, OpClass
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    SearchVector,
+    SearchVectorField,
+    TrigramSimilarity,
+    TrigramWordSimilarity,
+)
 from django.core.validators import MinValueValidator
 from django.db import models
-from django.db.models import Exists, OuterRef, Value, BooleanField
-from django.db.models import UniqueConstraint
+from django.db.models import Exists, OuterRef, Prefetch, Q, Value, BooleanField
+from django.db.models import F, UniqueConstraint, Window
+from django.db.models.functions import RowNumber
 
 from recipes.constants import (
     CHARFIELD_MAX_LENGTH_LARGE,
     DEFAULT_CHARFIELD_MAX_LENGTH,
     NAME_MAX_LENGTH,
     TAG_NAME_MAX_LENGTH, TAG_SLUG_MAX_LENGTH, COOKING_TIME_MIN_VALUE,
-    AMOUNT_TIME_MIN_VALUE,
+    AMOUNT_TIME_MIN_VALUE, SEARCH_CONFIG, IMPORT_SOURCE_MAX_LENGTH,
 )
 from recipes.utils import get_short_string
+from users.models import Follow, StoredCountersMixin
+
+# Вектор хранится в сгенерированной колонке Recipe.search_vector: ранжирование
+# читает его, а не пересчитывает to_tsvector для каждой найденной строки.
+RECIPE_SEARCH_VECTOR = (
+    SearchVector('name', weight='A', config=SEARCH_CONFIG)
+    + SearchVector('text', weight='B', config=SEARCH_CONFIG)
+)
 
 
 class RecipeQuerySet(models.QuerySet):
     def with_user_flags(self, user):
         if user.is_authenticated:
-            fav_qs = Favourites.objects.filter(user=user,
+            fav_qs = Favourites.objects.filter(user=user.pk,
                                                recipe=OuterRef('pk'))
-            cart_qs = ShoppingList.objects.filter(user=user,
+            cart_qs = ShoppingList.objects.filter(user=user.pk,
                                                   recipe=OuterRef('pk'))
+            follow_qs = Follow.objects.filter(user=user.pk,
+                                              following=OuterRef('author'))
             return self.annotate(
                 is_favorited=Exists(fav_qs),
                 is_in_shopping_cart=Exists(cart_qs),
+                is_author_subscribed=Exists(follow_qs),
             )
         return self.annotate(
             is_favorited=Value(False, output_field=BooleanField()),
             is_in_shopping_cart=Value(False, output_field=BooleanField()),
+            is_author_subscribed=Value(False, output_field=BooleanField()),
+        )
+
+    def search(self, text):
+        """
+        Full-text search over name and text, ordered by relevance. Only the
+        first `RECIPE_SEARCH_CANDIDATES` matches are ranked, so a word found
+        in most recipes costs as much as a rare one, and the count for
+        pagination is capped as well. When full text finds nothing, the
+        query is matched by trigrams against words of the name instead, to
+        tolerate typos, up to `RECIPE_SEARCH_FUZZY_CANDIDATES` recipes.
+        The candidates are fetched right away, in a query of their own.
+        """
+        query = SearchQuery(text, config=SEARCH_CONFIG,
+                            search_type='websearch')
+        candidates = self._search_candidates(
+            Q(search_vector=query), settings.RECIPE_SEARCH_CANDIDATES
+        )
+        rank = (SearchRank(F('search_vector'), query)
+                + TrigramSimilarity('name', text))
+        if not candidates:
+            # Сходство со словом названия, а не со всем названием: «борш»
+            # похож на «Борщ домашний», хотя с названием целиком — нет.
+            candidates = self._search_candidates(
+                Q(name__trigram_word_similar=text),
+                settings.RECIPE_SEARCH_FUZZY_CANDIDATES,
+            )
+            rank = TrigramWordSimilarity(text, 'name')
+        return (
+            self.filter(pk__in=candidates)
+            .annotate(rank=rank)
+            .order_by('-rank', 'id')
+        )
+
+    def _search_candidates(self, condition, limit):
+        # Без сортировки Postgres останавливает скан индекса на LIMIT.
+        return list(
+            self.filter(condition).order_by()
+            .values_list('pk', flat=True)[:limit]
+        )
+
+    def with_related(self):
+        """
+        Loads everything `RecipeSerializer` reads in a fixed number of
+        queries: the author is joined, tags and ingredients are fetched
+        once for the whole page.
+        """
+        return self.select_related('author').prefetch_related(
+            'tags',
+            Prefetch(
+                'recipe_ingredients',
+                queryset=RecipeIngredient.objects.select_related(
+                    'ingredient'
+                ),
+            ),
         )
 
+    def latest_per_author(self, author_ids, limit=None):
+        """
+        Newest recipes of each of the given authors, at most `limit` per
+        author, for a whole page of authors in one query.
+        """
+        queryset = self.filter(author__in=author_ids)
+        if limit is not None:
+            queryset = queryset.annotate(row=Window(
+                RowNumber(),
+                partition_by=F('author'),
+                order_by=(F('pub_date').desc(), F('id').desc()),
+            )).filter(row__lte=limit)
+        return queryset.order_by('-pub_date', '-id')
+
 
 class RecipeManager(models.Manager):
     def get_queryset(self):
-        return RecipeQuerySet(self.model, using=self._db)
+        # Вектор нужен только в SQL поиска, в объекты его не загружаем.
+        return RecipeQuerySet(self.model, using=self._db).defer(
+            'search_vector'
+        )
 
     # чтобы можно было вызывать прямо от Recipe.objects
     def with_user_flags(self, user):
         return self.get_queryset().with_user_flags(user)
 
+    def with_related(self):
+        return self.get_queryset().with_related()
+
+    def search(self, text):
+        return self.get_queryset().search(text)
+
+    def latest_per_author(self, author_ids, limit=None):
+        return self.get_queryset().latest_per_author(author_ids, limit)
+
 
 class Tag(models.Model):
     name = models.CharField(
@@ -65,7 +165,7 @@ class Tag(models.Model):
         return self.name
 
 
-class Recipe(models.Model):
+class Recipe(StoredCountersMixin, models.Model):
     objects = RecipeManager()
     author = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -101,6 +201,9 @@ class Recipe(models.Model):
     pub_date = models.DateTimeField(
         'Дата публикации', auto_now_add=True
     )
+    updated_at = models.DateTimeField(
+        'Дата изменения', auto_now=True
+    )
     short_url = models.CharField(
         max_length=DEFAULT_CHARFIELD_MAX_LENGTH,
         unique=True,
@@ -109,25 +212,35 @@ class Recipe(models.Model):
         null=True,
         db_index=True,
     )
+    favourites_count = models.PositiveIntegerField(
+        'Добавлений в избранное', default=0, editable=False,
+    )
+    search_vector = models.GeneratedField(
+        expression=RECIPE_SEARCH_VECTOR,
+        output_field=SearchVectorField(),
+        db_persist=True,
+    )
+
+    counter_fields = ('favourites_count',)
 
     class Meta:
         default_related_name = 'recipes'
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ('-name',)
+        indexes = (
+            GinIndex(fields=('search_vector',),
+                     name='recipe_search_vector_gin_idx'),
+            # GiST, а не GIN: GIN строит битовую карту всех похожих
+            # названий до LIMIT, GiST отдаёт их по одному. Длинная
+            # сигнатура отсекает больше ветвей, когда похожих мало.
+            GistIndex(OpClass('name', name='gist_trgm_ops(siglen=64)'),
+                      name='recipe_name_trgm_gist_idx'),
+        )
 
     def __str__(self):
         return get_short_string(self.name)
 
-    def save(self, *args, **kwargs):
-        if not self.short_url:
-            from sqids import Sqids
-            timestamp = round(datetime.now().timestamp() * 1000)
-            code = Sqids().encode(
-                [timestamp, self.author_id, self.cooking_time])
-            self.short_url = code
-        super().save(*args, **kwargs)
-
 
 class Ingredient(models.Model):
     name = models.CharField(
@@ -202,7 +315,7 @@ class FavouritesAndShoppingList(models.Model):
 
 
 class Favourites(FavouritesAndShoppingList):
-    class Meta:
+    class Meta(FavouritesAndShoppingList.Meta):
         verbose_name = 'Избранное'
         verbose_name_plural = 'Избранное'
         default_related_name = 'favorites'
@@ -211,18 +324,9 @@ class Favourites(FavouritesAndShoppingList):
     def __str__(self):
         return f'Рецепт {self.recipe} в избранном у {self.user.username}'
 
-    def clean(self):
-        if Favourites.objects.filter(
-                user=self.user,
-                recipe=self.recipe
-        ).exists():
-            raise ValidationError({
-                'recipe': 'Рецепт уже в избранном.'
-            })
-
 
 class ShoppingList(FavouritesAndShoppingList):
-    class Meta:
+    class Meta(FavouritesAndShoppingList.Meta):
         verbose_name = 'Корзина'
         verbose_name_plural = 'Корзина'
         default_related_name = 'shopping_recipe'
@@ -231,11 +335,54 @@ class ShoppingList(FavouritesAndShoppingList):
     def __str__(self):
         return f'Рецепт {self.recipe} в списке покупок {self.user.username}'
 
-    def clean(self):
-        if ShoppingList.objects.filter(
-                user=self.user,
-                recipe=self.recipe
-        ).exists():
-            raise ValidationError({
-                'recipe': 'Рецепт уже в списке покупок.'
-            })
+
+class ShoppingListItem(models.Model):
+    """
+    Precomputed ingredient total in a user's shopping cart. Maintained
+    incrementally by `recipes.shopping_list` whenever the cart or the
+    ingredients of a recipe in it change.
+    """
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_items'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient, on_delete=models.CASCADE,
+        related_name='shopping_list_items'
+    )
+    total = models.IntegerField('Количество', default=0)
+
+    class Meta:
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Позиции списка покупок'
+        ordering = ('user', 'ingredient')
+        constraints = (
+            UniqueConstraint(
+                fields=('user', 'ingredient'),
+                name='unique_shopping_list_item_user_ingredient',
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.ingredient}: {self.total}'
+
+
+class ImportProgress(models.Model):
+    """
+    Position reached by `import_recipes` in a source file. Saved in the
+    same transaction as the batch it follows, so a crash can neither lose
+    a committed batch nor import it twice.
+    """
+    source = models.CharField(
+        'Источник', max_length=IMPORT_SOURCE_MAX_LENGTH, unique=True,
+    )
+    offset = models.PositiveBigIntegerField('Позиция в файле', default=0)
+    updated_at = models.DateTimeField('Дата изменения', auto_now=True)
+
+    class Meta:
+        verbose_name = 'Позиция импорта'
+        verbose_name_plural = 'Позиции импорта'
+
+    def __str__(self):
+        return f'{self.source}: {self.offset}'
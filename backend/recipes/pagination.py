@@ -1,8 +1,40 @@
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import CursorPagination, PageNumberPagination
 
 from django.conf import settings
 
 
+class RecipesCursorPagination(CursorPagination):
+    """
+    Keyset pagination by `id`: no COUNT(*) and no OFFSET scan, so every
+    page costs the same no matter how deep the client scrolls.
+    """
+    page_size = settings.RECIPES_PER_PAGE
+    page_size_query_param = 'limit'
+    ordering = 'id'
+
+
 class RecipesPagination(PageNumberPagination):
+    """
+    Page-number pagination with an opt-in cursor mode: a request that
+    carries `?cursor=` (even an empty one for the first page) is paginated
+    by `RecipesCursorPagination` instead. Querysets with their own ordering,
+    such as search results ranked by relevance, stay on page numbers.
+    """
     page_size = settings.RECIPES_PER_PAGE
     page_size_query_param = 'limit'
+    cursor_query_param = RecipesCursorPagination.cursor_query_param
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if (self.cursor_query_param in request.query_params
+                and tuple(queryset.query.order_by) in ((), ('id',))):
+            self.cursor_paginator = RecipesCursorPagination()
+            return self.cursor_paginator.paginate_queryset(
+                queryset, request, view
+            )
+        self.cursor_paginator = None
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -0,0 +1,152 @@
+from django.db import connection, transaction
+
+from recipes.cache import bump_versions_on_commit, user_version
+from recipes.models import Favourites, Recipe, ShoppingList
+from recipes.shopping_list import add_to_totals, subtract_from_totals
+
+ADDED = 'added'
+ALREADY_PRESENT = 'already_present'
+REMOVED = 'removed'
+NOT_PRESENT = 'not_present'
+NOT_FOUND = 'not_found'
+
+
+# Поля RecipeMinifiedSerializer: ответ 201 строится из той же строки.
+RECIPE_COLUMNS = ('id', 'name', 'image', 'cooking_time')
+
+
+def _count_favourites(model, delta):
+    """
+    CTE that shifts `favourites_count` of the changed recipes in the same
+    statement, never below zero; no CTE for other relations.
+    """
+    if model is not Favourites:
+        return ''
+    return (
+        f', counted AS (UPDATE {Recipe._meta.db_table} '
+        f'SET favourites_count = GREATEST(favourites_count + {delta}, 0) '
+        f'WHERE id IN (SELECT recipe_id FROM changed))'
+    )
+
+
+def _change(model, user_id, recipe_ids, changed_sql, delta):
+    """
+    Runs `changed_sql` (an INSERT or DELETE ... RETURNING recipe_id over
+    the found recipes `r`) in a single statement that also reads the
+    recipes and adjusts the favourites counter. Returns
+    {recipe_id: (changed, recipe)} for the recipes that exist.
+    """
+    table = Recipe._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'WITH r AS (SELECT {", ".join(RECIPE_COLUMNS)} FROM {table} '
+            f'WHERE id = ANY(%s)), '
+            f'changed AS ({changed_sql})'
+            f'{_count_favourites(model, delta)} '
+            f'SELECT r.*, changed.recipe_id IS NOT NULL FROM r '
+            f'LEFT JOIN changed ON changed.recipe_id = r.id',
+            [recipe_ids, user_id]
+        )
+        return {
+            row[0]: (row[-1], Recipe(**dict(zip(RECIPE_COLUMNS, row))))
+            for row in cursor.fetchall()
+        }
+
+
+def _insert(model, user_id, recipe_ids):
+    """
+    Missing recipes are skipped by the join and concurrent duplicates by
+    ON CONFLICT, so races never reach the client as IntegrityError.
+    """
+    return _change(
+        model, user_id, recipe_ids,
+        f'INSERT INTO {model._meta.db_table} (user_id, recipe_id) '
+        f'SELECT %s, id FROM r '
+        f'ON CONFLICT (user_id, recipe_id) DO NOTHING '
+        f'RETURNING recipe_id',
+        1,
+    )
+
+
+def _delete(model, user_id, recipe_ids):
+    return _change(
+        model, user_id, recipe_ids,
+        f'DELETE FROM {model._meta.db_table} '
+        f'WHERE user_id = %s AND recipe_id IN (SELECT id FROM r) '
+        f'RETURNING recipe_id',
+        -1,
+    )
+
+
+def _statuses(recipe_ids, found, changed_status, unchanged_status):
+    return {
+        pk: (NOT_FOUND if pk not in found else
+             changed_status if found[pk][0] else unchanged_status)
+        for pk in recipe_ids
+    }
+
+
+def _changed_ids(found):
+    return sorted(pk for pk, (changed, _) in found.items() if changed)
+
+
+def _add(model, user, recipe_ids):
+    found = _insert(model, user.pk, recipe_ids)
+    added = _changed_ids(found)
+    if added:
+        # Счётчик избранного уже сдвинут тем же запросом.
+        if model is ShoppingList:
+            add_to_totals(user.pk, added)
+        bump_versions_on_commit(user_version(user.pk))
+    return found
+
+
+def _remove(model, user, recipe_ids):
+    found = _delete(model, user.pk, recipe_ids)
+    removed = _changed_ids(found)
+    if removed:
+        if model is ShoppingList:
+            subtract_from_totals(user.pk, removed)
+        bump_versions_on_commit(user_version(user.pk))
+    return found
+
+
+@transaction.atomic
+def add_relations(model, user, recipe_ids):
+    """
+    Puts recipes into the user's favourites or shopping cart in a single
+    statement that also tells added, already present and missing recipes
+    apart. Returns {recipe_id: status} in the given order.
+    """
+    recipe_ids = list(dict.fromkeys(recipe_ids))
+    found = _add(model, user, recipe_ids)
+    return _statuses(recipe_ids, found, ADDED, ALREADY_PRESENT)
+
+
+@transaction.atomic
+def remove_relations(model, user, recipe_ids):
+    """
+    Takes recipes out of the user's favourites or shopping cart, the same
+    way as `add_relations`. Returns {recipe_id: status}.
+    """
+    recipe_ids = list(dict.fromkeys(recipe_ids))
+    found = _remove(model, user, recipe_ids)
+    return _statuses(recipe_ids, found, REMOVED, NOT_PRESENT)
+
+
+@transaction.atomic
+def add_relation(model, user, recipe_id):
+    """
+    Returns (status, recipe): the recipe is read by the same statement,
+    with the fields of `RecipeMinifiedSerializer`, or None if missing.
+    """
+    found = _add(model, user, [recipe_id])
+    status = _statuses([recipe_id], found, ADDED, ALREADY_PRESENT)
+    recipe = found[recipe_id][1] if recipe_id in found else None
+    return status[recipe_id], recipe
+
+
+@transaction.atomic
+def remove_relation(model, user, recipe_id):
+    found = _remove(model, user, [recipe_id])
+    return _statuses([recipe_id], found, REMOVED, NOT_PRESENT)[recipe_id]
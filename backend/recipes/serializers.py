@@ -1,19 +1,27 @@
+import json
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.db import transaction
 from rest_framework import serializers
 
+from api.instrumentation import InstrumentedSerializerMixin
+from recipes.constants import RECIPE_ID_MAX_VALUE
 from recipes.fields import Base64ImageField
 from recipes.models import (
     Ingredient,
     Recipe,
     RecipeIngredient,
+    ShoppingListItem,
     Tag, )
+from recipes.shopping_list import apply_recipe_deltas
+from users.models import Follow
 from users.serializers import UserSerializer
 
 User = get_user_model()
 
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(InstrumentedSerializerMixin, serializers.ModelSerializer):
     """Handles serialization and deserialization of Tag model."""
 
     class Meta:
@@ -21,12 +29,10 @@ class TagSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'slug')
 
 
-class IngredientInRecipeSerializer(serializers.ModelSerializer):
-    """ Serializer for writing ingredient amounts in a recipe."""
-    id = serializers.PrimaryKeyRelatedField(
-        source='ingredient',
-        queryset=Ingredient.objects.all()
-    )
+class IngredientInRecipeSerializer(InstrumentedSerializerMixin,
+                                   serializers.ModelSerializer):
+    """ Serializer for reading ingredient amounts in a recipe."""
+    id = serializers.ReadOnlyField(source='ingredient.id')
     name = serializers.ReadOnlyField(source='ingredient.name')
     measurement_unit = serializers.ReadOnlyField(
         source='ingredient.measurement_unit'
@@ -37,7 +43,21 @@ class IngredientInRecipeSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit', 'amount')
 
 
-class RecipeWriteSerializer(serializers.ModelSerializer):
+class IngredientAmountSerializer(serializers.ModelSerializer):
+    """
+    Serializer for writing ingredient amounts in a recipe. Ingredient ids
+    are plain integers here: `RecipeWriteSerializer` resolves all of them
+    with a single query.
+    """
+    id = serializers.IntegerField(min_value=1)
+
+    class Meta:
+        model = RecipeIngredient
+        fields = ('id', 'amount')
+
+
+class RecipeWriteSerializer(InstrumentedSerializerMixin,
+                            serializers.ModelSerializer):
     """
     Serializer for creating and updating Recipe objects with nested tags and
     ingredients.
@@ -46,13 +66,12 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
     author = serializers.HiddenField(
         default=serializers.CurrentUserDefault()
     )
-    ingredients = IngredientInRecipeSerializer(
+    ingredients = IngredientAmountSerializer(
         many=True,
         source='recipe_ingredients'
     )
-    tags = serializers.PrimaryKeyRelatedField(
-        many=True,
-        queryset=Tag.objects.all()
+    tags = serializers.ListField(
+        child=serializers.IntegerField(min_value=1)
     )
     image = Base64ImageField(use_url=True)
 
@@ -63,25 +82,85 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
             'tags', 'ingredients', 'cooking_time'
         )
 
+    def to_internal_value(self, data):
+        if hasattr(data, 'getlist'):
+            data = self._from_multipart(data)
+        return super().to_internal_value(data)
+
+    @staticmethod
+    def _from_multipart(data):
+        """
+        Multipart requests send the image as a file. Tags come as repeated
+        fields or a JSON list, ingredients as a JSON list.
+        """
+        values = {key: data.get(key) for key in data}
+        for field in ('tags', 'ingredients'):
+            if field not in data:
+                continue
+            items = data.getlist(field)
+            if len(items) == 1 and items[0].lstrip().startswith('['):
+                try:
+                    items = json.loads(items[0])
+                except ValueError:
+                    raise serializers.ValidationError(
+                        {field: ['Ожидается JSON-список.']}
+                    )
+            elif field == 'ingredients':
+                raise serializers.ValidationError(
+                    {field: ['Ожидается JSON-список.']}
+                )
+            values[field] = items
+        return values
+
     def validate(self, attrs):
         ingredients = attrs.get('recipe_ingredients', [])
         tags = attrs.get('tags', [])
         if not ingredients:
             raise serializers.ValidationError('Ингридент объязательное поле!')
-        ingredient_ids = [item['ingredient'].id for item in ingredients]
+        ingredient_ids = [item['id'] for item in ingredients]
         if not tags:
             raise serializers.ValidationError(
                 {'tags': 'Нужно указать хотя бы один тег.'})
-        tag_ids = [tag.id for tag in tags]
-        if len(tag_ids) != len(set(tag_ids)):
+        if len(tags) != len(set(tags)):
             raise serializers.ValidationError(
                 {'tags': 'Теги должны быть уникальными в одном рецепте.'})
         if len(ingredient_ids) != len(set(ingredient_ids)):
             raise serializers.ValidationError(
                 'Ингредиенты должны быть уникальными в рамках одного рецепта.'
             )
+        found_ingredients = Ingredient.objects.in_bulk(ingredient_ids)
+        found_tags = Tag.objects.in_bulk(tags)
+        errors = {}
+        missing = [pk for pk in ingredient_ids if pk not in found_ingredients]
+        if missing:
+            errors['ingredients'] = (
+                f'Ингредиенты не найдены: {", ".join(map(str, missing))}.'
+            )
+        missing = [pk for pk in tags if pk not in found_tags]
+        if missing:
+            errors['tags'] = (
+                f'Теги не найдены: {", ".join(map(str, missing))}.'
+            )
+        if errors:
+            raise serializers.ValidationError(errors)
+        attrs['recipe_ingredients'] = [
+            {'ingredient': found_ingredients[item['id']],
+             'amount': item['amount']}
+            for item in ingredients
+        ]
+        attrs['tags'] = [found_tags[pk] for pk in tags]
         return attrs
 
+    def save(self, **kwargs):
+        try:
+            return super().save(**kwargs)
+        finally:
+            # Временный файл уже перенесён хранилищем; закрываем явно,
+            # иначе сборщик мусора попытается удалить его ещё раз.
+            image = self.validated_data.get('image')
+            if image is not None:
+                image.close()
+
     def _save_ingredients(self, recipe, ingredients_data):
         objs = [
             RecipeIngredient(
@@ -92,34 +171,97 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
             for item in ingredients_data
         ]
         RecipeIngredient.objects.bulk_create(objs)
+        # Ответ собирается из этих же объектов, без повторных запросов.
+        self._written_ingredients = objs
 
     @transaction.atomic
     def create(self, validated_data):
         ingredients_data = validated_data.pop('recipe_ingredients', [])
         tags = validated_data.pop('tags', [])
         recipe = Recipe.objects.create(**validated_data)
-        recipe.tags.set(tags)
+        recipe.tags.add(*tags)
+        self._written_tags = tags
         self._save_ingredients(recipe, ingredients_data)
         return recipe
 
+    def _update_ingredients(self, recipe, ingredients_data):
+        """
+        Writes only the difference against the stored rows: unchanged
+        ingredients keep their rows and cost no writes.
+        """
+        current = {
+            item.ingredient_id: item
+            for item in RecipeIngredient.objects.filter(recipe=recipe)
+        }
+        kept, created, changed, deltas = [], [], [], {}
+        for data in ingredients_data:
+            ingredient, amount = data['ingredient'], data['amount']
+            item = current.pop(ingredient.id, None)
+            if item is None:
+                item = RecipeIngredient(
+                    recipe=recipe, ingredient=ingredient, amount=amount
+                )
+                created.append(item)
+                deltas[ingredient.id] = amount
+            else:
+                item.ingredient = ingredient
+                if item.amount != amount:
+                    deltas[ingredient.id] = amount - item.amount
+                    item.amount = amount
+                    changed.append(item)
+            kept.append(item)
+        for ingredient_id, item in current.items():
+            deltas[ingredient_id] = -item.amount
+
+        if current:
+            RecipeIngredient.objects.filter(
+                id__in=[item.id for item in current.values()]
+            ).delete()
+        if changed:
+            RecipeIngredient.objects.bulk_update(changed, ['amount'])
+        if created:
+            RecipeIngredient.objects.bulk_create(created)
+        apply_recipe_deltas(recipe.id, deltas)
+        self._written_ingredients = kept
+
     @transaction.atomic
     def update(self, instance, validated_data):
         ingredients_data = validated_data.pop('recipe_ingredients', None)
         tags = validated_data.pop('tags', None)
 
-        instance.tags.set(tags)
-        instance.ingredients.clear()
-        self._save_ingredients(instance, ingredients_data)
+        if tags is not None:
+            # set() сам сравнивает с текущими тегами и пишет только разницу.
+            instance.tags.set(tags)
+            self._written_tags = tags
+        else:
+            self._written_tags = list(instance.tags.all())
+        if ingredients_data is not None:
+            self._update_ingredients(instance, ingredients_data)
+        else:
+            self._written_ingredients = list(
+                instance.recipe_ingredients.select_related('ingredient')
+            )
         return super().update(instance, validated_data)
 
     def to_representation(self, instance):
-        return RecipeSerializer(
+        # Новый рецепт ещё никто не добавил в избранное и корзину, а на
+        # себя автор подписаться не может. При обновлении флаги уже
+        # посчитаны в with_user_flags.
+        for flag in ('is_favorited', 'is_in_shopping_cart',
+                     'is_author_subscribed'):
+            if not hasattr(instance, flag):
+                setattr(instance, flag, False)
+        # Порядок как у чтения из базы: Meta.ordering тегов и ингредиентов.
+        return FastRecipeSerializer(context=self.context).build(
             instance,
-            context=self.context
-        ).data
+            sorted(self._written_tags, key=lambda tag: tag.name),
+            sorted(self._written_ingredients,
+                   key=lambda item: item.ingredient.name),
+        )
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(InstrumentedSerializerMixin,
+                           serializers.ModelSerializer):
     """Serializer for Ingredient model."""
 
     class Meta:
@@ -127,7 +269,34 @@ class IngredientSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit')
 
 
-class RecipeMinifiedSerializer(serializers.ModelSerializer):
+class ShoppingListItemSerializer(InstrumentedSerializerMixin,
+                                 serializers.ModelSerializer):
+    """Serializer for precomputed ingredient totals of the shopping cart."""
+    id = serializers.ReadOnlyField(source='ingredient.id')
+    name = serializers.ReadOnlyField(source='ingredient.name')
+    measurement_unit = serializers.ReadOnlyField(
+        source='ingredient.measurement_unit'
+    )
+    amount = serializers.ReadOnlyField(source='total')
+
+    class Meta:
+        model = ShoppingListItem
+        fields = ('id', 'name', 'measurement_unit', 'amount')
+
+
+class RecipeIdsSerializer(serializers.Serializer):
+    """Validates the list of recipe ids for bulk favourite/cart requests."""
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(
+            min_value=1, max_value=RECIPE_ID_MAX_VALUE
+        ),
+        allow_empty=False,
+        max_length=settings.BULK_RELATIONS_MAX_RECIPES,
+    )
+
+
+class RecipeMinifiedSerializer(InstrumentedSerializerMixin,
+                               serializers.ModelSerializer):
     """Serializer for minimal recipe info in favorites and shopping cart."""
 
     class Meta:
@@ -135,7 +304,8 @@ class RecipeMinifiedSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'image', 'cooking_time')
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+class RecipeSerializer(InstrumentedSerializerMixin,
+                       serializers.ModelSerializer):
     """Serializer class for representing the `Recipe` model."""
     tags = TagSerializer(many=True, read_only=True)
     ingredients = IngredientInRecipeSerializer(
@@ -152,10 +322,92 @@ class RecipeSerializer(serializers.ModelSerializer):
             'is_in_shopping_cart', 'name', 'image', 'text', 'cooking_time'
         )
 
+    def to_representation(self, instance):
+        # Флаг подписки уже посчитан в with_user_flags, передаём его
+        # автору, чтобы UserSerializer не делал запрос на каждый рецепт.
+        if hasattr(instance, 'is_author_subscribed'):
+            instance.author.is_subscribed = instance.is_author_subscribed
+        return super().to_representation(instance)
+
     def _has_relation(self, obj, model):
         request = self.context.get('request')
         return bool(
             request
             and request.user.is_authenticated
-            and model.objects.filter(user=request.user, recipe=obj).exists()
+            and model.objects.filter(
+                user=request.user.pk, recipe=obj
+            ).exists()
+        )
+
+
+class FastRecipeSerializer(InstrumentedSerializerMixin,
+                           serializers.BaseSerializer):
+    """
+    Read-only twin of `RecipeSerializer` for list and detail pages.
+
+    Builds the same JSON by hand from a recipe loaded with
+    `with_related()` and `with_user_flags()`, skipping DRF's per-field
+    machinery which dominates CPU time on large pages.
+    """
+
+    def to_representation(self, instance):
+        return self.build(
+            instance, instance.tags.all(), instance.recipe_ingredients.all()
         )
+
+    def build(self, instance, tags, recipe_ingredients):
+        """Builds the representation from already loaded related objects."""
+        request = self.context.get('request')
+        return {
+            'id': instance.id,
+            'tags': [
+                {'id': tag.id, 'name': tag.name, 'slug': tag.slug}
+                for tag in tags
+            ],
+            'author': self._author(instance, request),
+            'ingredients': [
+                {
+                    'id': item.ingredient.id,
+                    'name': item.ingredient.name,
+                    'measurement_unit': item.ingredient.measurement_unit,
+                    'amount': item.amount,
+                }
+                for item in recipe_ingredients
+            ],
+            'is_favorited': getattr(instance, 'is_favorited', False),
+            'is_in_shopping_cart': getattr(
+                instance, 'is_in_shopping_cart', False
+            ),
+            'name': instance.name,
+            'image': self._image_url(instance.image, request),
+            'text': instance.text,
+            'cooking_time': instance.cooking_time,
+        }
+
+    def _author(self, instance, request):
+        author = instance.author
+        is_subscribed = getattr(instance, 'is_author_subscribed', None)
+        if is_subscribed is None:
+            is_subscribed = bool(
+                request and request.user.is_authenticated
+                and Follow.objects.filter(
+                    user=request.user.pk, following=author
+                ).exists()
+            )
+        return {
+            'username': author.username,
+            'id': author.id,
+            'email': author.email,
+            'first_name': author.first_name,
+            'last_name': author.last_name,
+            'is_subscribed': is_subscribed,
+            'avatar': self._image_url(author.avatar, request),
+        }
+
+    @staticmethod
+    def _image_url(image, request):
+        if not image:
+            return None
+        if request is not None:
+            return request.build_absolute_uri(image.url)
+        return image.url
@@ -0,0 +1,309 @@
+import csv
+import io
+import uuid
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import F
+from django.http import HttpResponse, StreamingHttpResponse
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import mm
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+from api.metrics import record_cache
+from recipes.cache import (
+    INGREDIENTS_VERSION,
+    bump_versions_on_commit,
+    cart_version,
+    get_versions,
+)
+from recipes.models import RecipeIngredient, ShoppingList, ShoppingListItem
+
+CONTENT_TYPES = {
+    'txt': 'text/plain; charset=utf-8',
+    'csv': 'text/csv; charset=utf-8',
+    'pdf': 'application/pdf',
+}
+CSV_HEADER = ('Ингредиент', 'Количество', 'Единица измерения')
+PDF_SLOT_KEY = 'shopping_list:pdf_slot:{}'
+
+
+class ShoppingListBusy(Exception):
+    """Too many PDF exports are being rendered right now."""
+
+
+def _cart_totals(where):
+    """
+    SELECT of (user_id, ingredient_id, total) over the shopping list rows
+    matched by `where`.
+    """
+    return (
+        f'SELECT sl.user_id, ri.ingredient_id, SUM(ri.amount) AS total '
+        f'FROM {ShoppingList._meta.db_table} sl '
+        f'JOIN {RecipeIngredient._meta.db_table} ri '
+        f'ON ri.recipe_id = sl.recipe_id '
+        f'WHERE {where} '
+        f'GROUP BY sl.user_id, ri.ingredient_id'
+    )
+
+
+def _recipes_totals(recipe_ids):
+    """
+    SELECT of (user_id, ingredient_id, total) for recipes put into or taken
+    out of one user's cart; doesn't depend on the shopping list rows, so it
+    works both before and after they are written.
+    """
+    return (
+        f'SELECT %s AS user_id, ri.ingredient_id, SUM(ri.amount) AS total '
+        f'FROM {RecipeIngredient._meta.db_table} ri '
+        f'WHERE ri.recipe_id IN ({", ".join(["%s"] * len(recipe_ids))}) '
+        f'GROUP BY ri.ingredient_id'
+    )
+
+
+def _add_totals(select, params):
+    """Adds the rows of `select` to the users' totals in one upsert."""
+    item = ShoppingListItem._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {item} (user_id, ingredient_id, total) '
+            f'{select} '
+            f'ON CONFLICT (user_id, ingredient_id) '
+            f'DO UPDATE SET total = {item}.total + EXCLUDED.total',
+            params
+        )
+
+
+def _subtract_totals(select, params):
+    item = ShoppingListItem._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'UPDATE {item} SET total = {item}.total - agg.total '
+            f'FROM ({select}) agg '
+            f'WHERE {item}.user_id = agg.user_id '
+            f'AND {item}.ingredient_id = agg.ingredient_id',
+            params
+        )
+
+
+def add_to_totals(user_id, recipe_ids):
+    """Adds recipes just put into the user's cart to the totals."""
+    if recipe_ids:
+        _add_totals(_recipes_totals(recipe_ids), [user_id, *recipe_ids])
+    bump_versions_on_commit(cart_version(user_id))
+
+
+def subtract_from_totals(user_id, recipe_ids):
+    """Subtracts recipes taken out of the user's cart from the totals."""
+    if recipe_ids:
+        _subtract_totals(_recipes_totals(recipe_ids), [user_id, *recipe_ids])
+        ShoppingListItem.objects.filter(
+            user_id=user_id, total__lte=0
+        ).delete()
+    bump_versions_on_commit(cart_version(user_id))
+
+
+def apply_recipe_deltas(recipe_id, deltas):
+    """
+    Applies {ingredient_id: amount change} of an edited recipe to the
+    totals of every user who has it in the cart, in one upsert.
+    """
+    deltas = {pk: delta for pk, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    user_ids = list(ShoppingList.objects.filter(
+        recipe_id=recipe_id
+    ).order_by().values_list('user_id', flat=True))
+    if not user_ids:
+        return
+    rows = ' UNION ALL '.join(
+        ['SELECT %s AS ingredient_id, %s AS total'] * len(deltas)
+    )
+    _add_totals(
+        f'SELECT sl.user_id, d.ingredient_id, d.total '
+        f'FROM {ShoppingList._meta.db_table} sl '
+        f'CROSS JOIN ({rows}) d '
+        f'WHERE sl.recipe_id = %s',
+        [*(value for item in deltas.items() for value in item), recipe_id]
+    )
+    ShoppingListItem.objects.filter(
+        user__in=user_ids, ingredient__in=deltas, total__lte=0
+    ).delete()
+    bump_versions_on_commit(*(cart_version(pk) for pk in user_ids))
+
+
+def rebuild_totals():
+    """Recomputes all totals from the carts, repairing any drift."""
+    ShoppingListItem.objects.all().delete()
+    _add_totals(_cart_totals('1 = 1'), [])
+
+
+def get_rows(user):
+    return (
+        ShoppingListItem.objects
+        .filter(user=user.pk, total__gt=0)
+        .values(
+            'total',
+            name=F('ingredient__name'),
+            unit=F('ingredient__measurement_unit'),
+        )
+        .order_by('name')
+    )
+
+
+def iter_txt(rows):
+    separator = ''
+    for row in rows:
+        yield f"{separator}{row['name']} — {row['total']} {row['unit']}"
+        separator = '\n'
+
+
+class _Echo:
+    """File-like object that hands back what csv.writer writes."""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(CSV_HEADER)
+    for row in rows:
+        yield writer.writerow((row['name'], row['total'], row['unit']))
+
+
+@lru_cache(maxsize=None)
+def _pdf_font():
+    try:
+        pdfmetrics.registerFont(
+            TTFont('ShoppingListFont', settings.SHOPPING_LIST_PDF_FONT)
+        )
+    except Exception:
+        # Без TTF-шрифта кириллица не отрисуется, но файл всё равно
+        # соберётся.
+        return 'Helvetica'
+    return 'ShoppingListFont'
+
+
+def render_pdf(rows, on_page=None):
+    """Renders the rows into a PDF, calling `on_page` before each new page."""
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=A4)
+    font = _pdf_font()
+    width, height = A4
+    top, bottom, left, step = height - 20 * mm, 20 * mm, 20 * mm, 7 * mm
+
+    pdf.setFont(font, 16)
+    pdf.drawString(left, top, 'Список покупок')
+    y = top - 2 * step
+    pdf.setFont(font, 12)
+    for row in rows:
+        if y < bottom:
+            if on_page is not None:
+                on_page()
+            pdf.showPage()
+            pdf.setFont(font, 12)
+            y = top
+        pdf.drawString(
+            left, y, f"{row['name']} — {row['total']} {row['unit']}"
+        )
+        y -= step
+    pdf.save()
+    return buffer.getvalue()
+
+
+def _acquire_pdf_slot():
+    """
+    Takes one of SHOPPING_LIST_PDF_MAX_INFLIGHT slot keys, so a burst of
+    exports is rejected instead of occupying every worker. Each key holds
+    the token of its holder and expires after SHOPPING_LIST_PDF_SLOT_TIMEOUT
+    in case a worker died holding it. The slots span workers only with a
+    shared cache (REDIS_URL); with the local-memory cache they are per
+    process. Returns (key, token) or None when every slot is taken.
+    """
+    token = uuid.uuid4().hex
+    for index in range(settings.SHOPPING_LIST_PDF_MAX_INFLIGHT):
+        key = PDF_SLOT_KEY.format(index)
+        if cache.add(key, token,
+                     timeout=settings.SHOPPING_LIST_PDF_SLOT_TIMEOUT):
+            return key, token
+    return None
+
+
+def _touch_pdf_slot(slot):
+    # Долгий рендер продлевает свой слот, пока тот ещё его.
+    key, token = slot
+    if cache.get(key) == token:
+        cache.touch(key, settings.SHOPPING_LIST_PDF_SLOT_TIMEOUT)
+
+
+def _release_pdf_slot(slot):
+    # Истёкший слот мог уже достаться другому рендеру, чужой не трогаем.
+    key, token = slot
+    if cache.get(key) == token:
+        cache.delete(key)
+
+
+def _cache_key(user, fmt):
+    versions = get_versions(cart_version(user.pk), INGREDIENTS_VERSION)
+    return f'shopping_list:{user.pk}:{fmt}:' + ':'.join(map(str, versions))
+
+
+def _cached_stream(chunks, key):
+    """Streams encoded chunks and caches the whole file if it is small."""
+    parts, size = [], 0
+    for chunk in chunks:
+        data = chunk.encode()
+        size += len(data)
+        if parts is not None:
+            parts.append(data)
+            if size > settings.SHOPPING_LIST_CACHE_MAX_SIZE:
+                parts = None
+        yield data
+    if parts is not None:
+        cache.set(key, b''.join(parts),
+                  timeout=settings.SHOPPING_LIST_CACHE_TIMEOUT)
+
+
+def shopping_list_response(user, fmt):
+    """
+    Builds the shopping list download in the given format. Text and CSV are
+    streamed from a server-side cursor, concurrent PDF renders are capped
+    by shared slots. Repeat downloads of an unchanged cart are served from
+    the cache.
+    """
+    key = _cache_key(user, fmt)
+    content = cache.get(key)
+    record_cache('shopping_list', 'miss' if content is None else 'hit')
+    if content is not None:
+        response = HttpResponse(content, content_type=CONTENT_TYPES[fmt])
+    elif fmt == 'pdf':
+        slot = _acquire_pdf_slot()
+        if slot is None:
+            raise ShoppingListBusy
+        # Рендер идёт прямо в воркере: слот занят ровно столько, сколько
+        # длится рендер, и лимит не превышается под нагрузкой.
+        try:
+            content = render_pdf(list(get_rows(user)),
+                                 on_page=lambda: _touch_pdf_slot(slot))
+        finally:
+            _release_pdf_slot(slot)
+        cache.set(key, content,
+                  timeout=settings.SHOPPING_LIST_CACHE_TIMEOUT)
+        response = HttpResponse(content, content_type=CONTENT_TYPES[fmt])
+    else:
+        rows = get_rows(user).iterator(
+            chunk_size=settings.SHOPPING_LIST_CHUNK_SIZE
+        )
+        chunks = iter_txt(rows) if fmt == 'txt' else iter_csv(rows)
+        response = StreamingHttpResponse(
+            _cached_stream(chunks, key), content_type=CONTENT_TYPES[fmt]
+        )
+    response['Content-Disposition'] = (
+        f'attachment; filename="shopping_list.{fmt}"'
+    )
+    return response
@@ -0,0 +1,69 @@
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from sqids import Sqids
+
+from recipes.models import Recipe
+
+_sqids = Sqids(min_length=settings.SHORT_LINK_MIN_LENGTH)
+_known = OrderedDict()
+_lock = threading.Lock()
+
+
+def encode(recipe_id):
+    """Short code of a recipe: the id itself, so decoding needs no query."""
+    return _sqids.encode([recipe_id])
+
+
+def decode(code):
+    """
+    Returns the recipe id of a code made by `encode`, or None. Sqids can
+    decode several strings to the same id, so only the canonical one is
+    accepted.
+    """
+    ids = _sqids.decode(code)
+    if len(ids) != 1 or _sqids.encode(ids) != code:
+        return None
+    return ids[0]
+
+
+def _remember(code, recipe_id):
+    with _lock:
+        _known[code] = recipe_id
+        _known.move_to_end(code)
+        while len(_known) > settings.SHORT_LINK_CACHE_SIZE:
+            _known.popitem(last=False)
+
+
+def forget(recipe):
+    with _lock:
+        _known.pop(encode(recipe.pk), None)
+        if recipe.short_url:
+            _known.pop(recipe.short_url, None)
+
+
+def resolve(code):
+    """
+    Returns the id of the recipe behind a short code, or None. Recently
+    resolved codes are answered from a per-process LRU without touching
+    the database. Codes issued before the switch to id-based codes are
+    looked up by the stored `short_url`.
+    """
+    with _lock:
+        recipe_id = _known.get(code)
+        if recipe_id is not None:
+            _known.move_to_end(code)
+            return recipe_id
+    recipe_id = decode(code)
+    if recipe_id is not None:
+        if not Recipe.objects.filter(pk=recipe_id).exists():
+            return None
+    else:
+        recipe_id = Recipe.objects.filter(
+            short_url=code
+        ).values_list('pk', flat=True).first()
+        if recipe_id is None:
+            return None
+    _remember(code, recipe_id)
+    return recipe_id
@@ -1,23 +1,171 @@
-from django.db.models.signals import pre_delete, pre_save
+from django.contrib.auth import get_user_model
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_init,
+    post_save,
+    pre_delete,
+)
 from django.dispatch import receiver
 
-from .models import Recipe
+from .cache import (
+    INGREDIENTS_VERSION,
+    RECIPES_VERSION,
+    TAGS_VERSION,
+    bump_versions_on_commit,
+    profile_version,
+    user_version,
+)
+from . import short_links
+from .counters import increment
+from .media import delete_files, delete_replaced_files, remember_files
+from .models import (
+    Favourites,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    ShoppingList,
+    Tag,
+)
+from .shopping_list import add_to_totals, subtract_from_totals
 
+User = get_user_model()
 
-@receiver(pre_delete, sender=Recipe)
+
+RECIPE_FILES = ('image',)
+
+
+@receiver(post_init, sender=Recipe)
+def remember_recipe_image(sender, instance: Recipe, **kwargs):
+    remember_files(instance, RECIPE_FILES)
+
+
+@receiver(post_delete, sender=Recipe)
 def delete_recipe_image(sender, instance: Recipe, **kwargs):
-    if instance.image:
-        instance.image.delete(save=False)
+    delete_files(instance, RECIPE_FILES)
 
 
-@receiver(pre_save, sender=Recipe)
-def delete_old_recipe_image(sender, instance: Recipe, **kwargs):
-    if not instance.pk:
-        return
-    try:
-        old = Recipe.objects.get(pk=instance.pk)
-    except Recipe.DoesNotExist:
+@receiver(post_delete, sender=Recipe)
+def forget_short_link(sender, instance: Recipe, **kwargs):
+    short_links.forget(instance)
+
+
+@receiver(post_save, sender=Recipe)
+def delete_old_recipe_image(sender, instance: Recipe, update_fields=None,
+                            **kwargs):
+    delete_replaced_files(instance, RECIPE_FILES, update_fields)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_recipes_cache(sender, **kwargs):
+    bump_versions_on_commit(RECIPES_VERSION)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_tags_cache(sender, **kwargs):
+    bump_versions_on_commit(TAGS_VERSION, RECIPES_VERSION)
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_ingredients_cache(sender, **kwargs):
+    bump_versions_on_commit(INGREDIENTS_VERSION, RECIPES_VERSION)
+
+
+# Поля пользователя, которые выводятся в рецептах как данные автора.
+AUTHOR_FIELDS = ('username', 'first_name', 'last_name', 'avatar')
+
+
+def _author_values(instance):
+    # Отложенные поля не читаем: это стоило бы запроса.
+    return {
+        field: getattr(instance.__dict__[field], 'name',
+                       instance.__dict__[field])
+        for field in AUTHOR_FIELDS if field in instance.__dict__
+    }
+
+
+@receiver(post_init, sender=User)
+def remember_author_fields(sender, instance, **kwargs):
+    instance._original_author = _author_values(instance)
+
+
+@receiver(post_save, sender=User)
+def invalidate_recipes_cache_for_author(sender, instance, created,
+                                        **kwargs):
+    """
+    Drops cached recipes only when the user is shown in them as an author:
+    registrations, logins, password changes and edits of other fields
+    leave the shared recipe cache alone.
+    """
+    original = instance._original_author
+    current = _author_values(instance)
+    instance._original_author = current
+    if created or not any(
+        field not in original or original[field] != value
+        for field, value in current.items()
+    ):
         return
-    else:
-        if old.image and old.image != instance.image:
-            old.image.delete(save=False)
+    versions = [profile_version(instance.pk)]
+    if instance.recipes_count:
+        versions.append(RECIPES_VERSION)
+    bump_versions_on_commit(*versions)
+
+
+@receiver(post_delete, sender=User)
+def invalidate_recipes_cache_for_deleted_author(sender, instance, **kwargs):
+    if instance.recipes_count:
+        bump_versions_on_commit(RECIPES_VERSION,
+                                profile_version(instance.pk))
+
+
+@receiver(post_save, sender=Favourites)
+@receiver(post_delete, sender=Favourites)
+@receiver(post_save, sender=ShoppingList)
+@receiver(post_delete, sender=ShoppingList)
+def invalidate_user_flags(sender, instance, **kwargs):
+    bump_versions_on_commit(user_version(instance.user_id))
+
+
+@receiver(post_save, sender=ShoppingList)
+def add_cart_totals(sender, instance: ShoppingList, created, **kwargs):
+    if created:
+        add_to_totals(instance.user_id, [instance.recipe_id])
+
+
+@receiver(pre_delete, sender=ShoppingList)
+def subtract_cart_totals(sender, instance: ShoppingList, **kwargs):
+    # pre_delete: ингредиенты рецепта ещё на месте, даже если рецепт
+    # удаляется каскадом вместе с корзиной.
+    subtract_from_totals(instance.user_id, [instance.recipe_id])
+
+
+@receiver(post_save, sender=Favourites)
+def count_favourite_added(sender, instance: Favourites, created, **kwargs):
+    if created:
+        increment(Recipe.objects.filter(pk=instance.recipe_id),
+                  'favourites_count')
+
+
+@receiver(post_delete, sender=Favourites)
+def count_favourite_removed(sender, instance: Favourites, **kwargs):
+    increment(Recipe.objects.filter(pk=instance.recipe_id),
+              'favourites_count', -1)
+
+
+@receiver(post_save, sender=Recipe)
+def count_recipe_added(sender, instance: Recipe, created, **kwargs):
+    if created:
+        increment(User.objects.filter(pk=instance.author_id),
+                  'recipes_count')
+
+
+@receiver(post_delete, sender=Recipe)
+def count_recipe_removed(sender, instance: Recipe, **kwargs):
+    increment(User.objects.filter(pk=instance.author_id),
+              'recipes_count', -1)
@@ -0,0 +1,543 @@
+import importlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+from unittest import mock
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.conf import settings
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from prometheus_client import REGISTRY
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APIRequestFactory
+
+from api.instrumentation import RequestStats, request_stats
+from api.middleware import QueryInstrumentationMiddleware
+from recipes.ingredient_index import IngredientIndex
+from recipes.management.commands.import_recipes import Command
+from recipes.models import (
+    Favourites,
+    ImportProgress,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    ShoppingList,
+    Tag,
+)
+from recipes.serializers import RecipeSerializer
+from recipes import shopping_list
+from recipes.shopping_list import PDF_SLOT_KEY
+from users.models import Follow, User
+from users.serializers import UserSerializer
+
+
+class RecipesTestCase(TestCase):
+    """Authors, tags, ingredients and recipes shared by the API tests."""
+
+    recipes_count = 0
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create_user(
+                email=f'user{i}@example.com', username=f'user{i}',
+                first_name='Имя', last_name='Фамилия', password='secret-pass',
+            )
+            for i in range(3)
+        ]
+        cls.token = Token.objects.create(user=cls.users[0])
+        cls.tags = [
+            Tag.objects.create(name=f'Тег {i}', slug=f'tag{i}')
+            for i in range(3)
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(name=f'Ингредиент {i}',
+                                      measurement_unit='г')
+            for i in range(10)
+        ]
+        cls.recipes = []
+        for i in range(cls.recipes_count):
+            recipe = Recipe.objects.create(
+                author=cls.users[i % len(cls.users)], name=f'Рецепт {i}',
+                text='Описание', cooking_time=i + 1,
+                image=f'recipes/images/{i}.png',
+            )
+            recipe.tags.set(cls.tags[:i % len(cls.tags) + 1])
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(
+                    recipe=recipe, amount=k + 1,
+                    ingredient=cls.ingredients[(i + k) % 10],
+                )
+                for k in range(3)
+            )
+            cls.recipes.append(recipe)
+
+    def setUp(self):
+        cache.clear()
+        self.anon = APIClient()
+        self.auth = APIClient()
+        self.auth.credentials(HTTP_AUTHORIZATION=f'Token {self.token}')
+
+
+class RecipeListQueriesTest(RecipesTestCase):
+    """The recipe list costs a fixed number of queries per page."""
+
+    recipes_count = 50
+
+    def _count_queries(self, client, url):
+        with CaptureQueriesContext(connection) as captured:
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(captured), response.data
+
+    def _assert_constant(self, client):
+        # Токен кешируется после первого запроса, прогреваем его заранее.
+        client.get('/api/tags/')
+        small, data = self._count_queries(client, '/api/recipes/?limit=1')
+        self.assertEqual(len(data['results']), 1)
+        large, data = self._count_queries(client, '/api/recipes/?limit=50')
+        self.assertEqual(len(data['results']), 50)
+        self.assertEqual(small, large)
+
+    def test_anonymous(self):
+        self._assert_constant(self.anon)
+
+    def test_authenticated(self):
+        self._assert_constant(self.auth)
+
+
+class FastRecipeSerializerParityTest(RecipesTestCase):
+    """
+    The hand-built serializer with orjson must produce the same bytes as
+    `RecipeSerializer` rendered by DRF's `JSONRenderer`.
+    """
+
+    recipes_count = 8
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        user = cls.users[0]
+        Favourites.objects.create(user=user, recipe=cls.recipes[1])
+        ShoppingList.objects.create(user=user, recipe=cls.recipes[2])
+        Follow.objects.create(user=user, following=cls.users[1])
+
+    def _request(self, url, user):
+        request = APIRequestFactory().get(url)
+        request.user = user
+        return request
+
+    def _assert_parity(self, client, url, user):
+        response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        request = self._request(url, user)
+        # Флаги пользователя RecipeSerializer берёт из аннотаций, как во вьюхе.
+        page = Recipe.objects.with_user_flags(user).filter(
+            pk__in=[item['id'] for item in response.data['results']]
+        ).order_by('id')
+        data = RecipeSerializer(
+            page, many=True, context={'request': request}
+        ).data
+        self.assertEqual(
+            response.content,
+            JSONRenderer().render({**response.data, 'results': data}),
+        )
+
+    def test_anonymous_page(self):
+        self._assert_parity(self.anon, '/api/recipes/?limit=8',
+                            AnonymousUser())
+
+    def test_authenticated_page(self):
+        self._assert_parity(self.auth, '/api/recipes/?limit=8',
+                            self.users[0])
+
+    def test_authenticated_detail(self):
+        url = f'/api/recipes/{self.recipes[1].pk}/'
+        response = self.auth.get(url)
+        self.assertTrue(response.data['is_favorited'])
+        self.assertEqual(
+            response.content,
+            JSONRenderer().render(RecipeSerializer(
+                Recipe.objects.with_user_flags(self.users[0]).get(
+                    pk=self.recipes[1].pk
+                ),
+                context={'request': self._request(url, self.users[0])},
+            ).data),
+        )
+
+
+class IngredientListConditionalGetTest(RecipesTestCase):
+    recipes_count = 2
+
+    def test_not_modified(self):
+        response = self.anon.get('/api/ingredients/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('ETag', response)
+        response = self.anon.get('/api/ingredients/',
+                                 HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    @override_settings(INGREDIENT_INDEX_TTL=0)
+    def test_etag_follows_popularity(self):
+        etag = self.anon.get('/api/ingredients/?name=ингр')['ETag']
+        RecipeIngredient.objects.create(
+            recipe=self.recipes[0], ingredient=self.ingredients[9], amount=1
+        )
+        response = self.anon.get('/api/ingredients/?name=ингр',
+                                 HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class CacheMetricsTest(RecipesTestCase):
+    recipes_count = 1
+
+    def _misses(self):
+        cache.clear()
+        self.anon.get('/api/recipes/')
+        return REGISTRY.get_sample_value(
+            'foodgram_cache_requests_total',
+            {'cache': 'recipes', 'result': 'miss'},
+        ) or 0
+
+    @override_settings(METRICS_ENABLED=False)
+    def test_disabled_metrics_are_not_counted(self):
+        self.assertEqual(self._misses(), self._misses())
+
+    @override_settings(METRICS_ENABLED=True)
+    def test_enabled_metrics_are_counted(self):
+        self.assertEqual(self._misses() + 1, self._misses())
+
+
+class IngredientIndexTest(RecipesTestCase):
+    recipes_count = 1
+
+    def test_stale_index_is_served_during_rebuild(self):
+        index = IngredientIndex()
+        index.build()
+        names = [item['name'] for item in index.search('ингр')]
+        with override_settings(INGREDIENT_INDEX_TTL=0), index._lock:
+            # Другой поток уже перестраивает индекс: ответ по старому.
+            self.assertEqual(
+                [item['name'] for item in index.search('ингр')], names
+            )
+
+    def test_worker_starts_when_cache_is_down(self):
+        with mock.patch('recipes.ingredient_index.get_version',
+                        side_effect=ConnectionError):
+            importlib.reload(importlib.import_module('config.wsgi'))
+
+
+class QueryInstrumentationTest(RecipesTestCase):
+    recipes_count = 2
+
+    def test_query_is_attributed_to_serializer_field(self):
+        request = APIRequestFactory().get('/api/users/')
+        request.user = self.users[0]
+        stats = RequestStats()
+        token = request_stats.set(stats)
+        try:
+            with connection.execute_wrapper(
+                QueryInstrumentationMiddleware._execute
+            ):
+                UserSerializer(self.users[1],
+                               context={'request': request}).data
+        finally:
+            request_stats.reset(token)
+        self.assertEqual([source for _, _, source in stats.queries],
+                         ['UserSerializer.is_subscribed'])
+        self.assertGreater(stats.serialize, 0)
+        self.assertIsNone(stats.serializer)
+
+    @override_settings(SQL_INSTRUMENTATION=True)
+    def test_headers(self):
+        response = APIClient().get('/api/recipes/')
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(int(response['X-Query-Count']), 0)
+        self.assertIn('serialize;dur=', response['Server-Timing'])
+        self.assertIsNone(request_stats.get())
+
+
+class ShoppingListPdfTest(RecipesTestCase):
+    recipes_count = 2
+    url = '/api/recipes/download_shopping_cart/?format=pdf'
+
+    def setUp(self):
+        super().setUp()
+        ShoppingList.objects.create(user=self.users[0],
+                                    recipe=self.recipes[0])
+
+    def _slots(self):
+        return [
+            cache.get(PDF_SLOT_KEY.format(index))
+            for index in range(settings.SHOPPING_LIST_PDF_MAX_INFLIGHT)
+        ]
+
+    def test_slot_is_released_after_render(self):
+        response = self.auth.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content.startswith(b'%PDF'))
+        self.assertEqual(set(self._slots()), {None})
+
+    def test_busy_when_all_slots_taken(self):
+        for index in range(settings.SHOPPING_LIST_PDF_MAX_INFLIGHT):
+            cache.set(PDF_SLOT_KEY.format(index), f'other{index}')
+        response = self.auth.get(self.url)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '5')
+        self.assertEqual(
+            self._slots(),
+            [f'other{index}' for index in
+             range(settings.SHOPPING_LIST_PDF_MAX_INFLIGHT)],
+        )
+
+    def test_slot_expired_during_render(self):
+        render_pdf = shopping_list.render_pdf
+        key = PDF_SLOT_KEY.format(0)
+
+        def expire_and_render(rows, on_page=None):
+            # Слот истёк посреди рендера и достался другому запросу.
+            cache.set(key, 'other')
+            return render_pdf(rows, on_page)
+
+        with mock.patch.object(shopping_list, 'render_pdf',
+                               side_effect=expire_and_render):
+            response = self.auth.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(cache.get(key), 'other')
+        self.assertEqual(set(self._slots()[1:]), {None})
+
+
+class FavoriteRaceTest(TransactionTestCase):
+    """
+    Concurrent toggles of one favourite never fail with a server error,
+    and the stored counter ends up equal to the number of rows.
+    """
+
+    threads = 8
+    toggles = 10
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            email='racer@example.com', username='racer',
+            first_name='Имя', last_name='Фамилия', password='secret-pass',
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.recipe = Recipe.objects.create(
+            author=self.user, name='Суп', text='Варить', cooking_time=10,
+            image='recipes/images/soup.png',
+        )
+
+    def _toggle(self, barrier, statuses):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {self.token}')
+        url = f'/api/recipes/{self.recipe.pk}/favorite/'
+        try:
+            barrier.wait()
+            for _ in range(self.toggles):
+                statuses.append(client.post(url).status_code)
+                statuses.append(client.delete(url).status_code)
+        finally:
+            # У каждого потока своё соединение с базой.
+            connection.close()
+
+    def test_concurrent_toggles(self):
+        barrier = threading.Barrier(self.threads)
+        statuses = []
+        workers = [
+            threading.Thread(target=self._toggle, args=(barrier, statuses))
+            for _ in range(self.threads)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        self.assertEqual(len(statuses), 2 * self.threads * self.toggles)
+        self.assertLessEqual(set(statuses), {201, 204, 400})
+        self.recipe.refresh_from_db()
+        self.assertEqual(
+            self.recipe.favourites_count,
+            Favourites.objects.filter(recipe=self.recipe).count(),
+        )
+
+
+class GenerateFakeDataTest(RecipesTestCase):
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+
+    def test_every_recipe_has_its_own_image(self):
+        call_command('generate_fake_data', users=5, recipes=12,
+                     batch_size=5, stdout=io.StringIO())
+        images = list(Recipe.objects.filter(
+            author__username__startswith='bench'
+        ).values_list('image', flat=True))
+        self.assertEqual(len(images), 12)
+        self.assertEqual(len(set(images)), 12)
+
+
+class RunBenchmarkTest(RecipesTestCase):
+    recipes_count = 2
+
+    @override_settings(ALLOWED_HOSTS=[], DEBUG=True)
+    def test_empty_allowed_hosts(self):
+        output = io.StringIO()
+        call_command('run_benchmark', repeat=2, warmup=0,
+                     only=['recipes_list'], stdout=output)
+        self.assertIn('statuses=[200]', output.getvalue())
+
+
+class RecipeSearchTest(RecipesTestCase):
+    recipes_count = 3
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        Recipe.objects.filter(pk=cls.recipes[0].pk).update(
+            name='Суп дня', text='Борщ на говяжьем бульоне'
+        )
+        Recipe.objects.filter(pk=cls.recipes[1].pk).update(
+            name='Борщ домашний'
+        )
+
+    def test_name_match_ranks_above_text_match(self):
+        response = self.anon.get('/api/recipes/?search=борщ')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [item['id'] for item in response.data['results']],
+            [self.recipes[1].pk, self.recipes[0].pk],
+        )
+
+    def test_trigram_fallback_when_full_text_finds_nothing(self):
+        response = self.anon.get('/api/recipes/?search=борш')
+        self.assertEqual(
+            [item['id'] for item in response.data['results']],
+            [self.recipes[1].pk],
+        )
+
+    @override_settings(RECIPE_SEARCH_CANDIDATES=1)
+    def test_candidates_are_capped(self):
+        response = self.anon.get('/api/recipes/?search=борщ')
+        self.assertEqual(response.data['count'], 1)
+
+
+class ImportRecipesResumeTest(TransactionTestCase):
+    """A rerun after a failed batch imports every recipe exactly once."""
+
+    def setUp(self):
+        Tag.objects.create(name='Обед', slug='lunch')
+        Ingredient.objects.create(name='Свёкла', measurement_unit='г')
+        fd, self.path = tempfile.mkstemp(suffix='.ndjson')
+        self.addCleanup(os.remove, self.path)
+        with os.fdopen(fd, 'w', encoding='utf-8') as file:
+            for i in range(6):
+                file.write(json.dumps({
+                    'id': i,
+                    'author': {
+                        'email': 'cook@example.com', 'username': 'cook',
+                        'first_name': 'Имя', 'last_name': 'Фамилия',
+                    },
+                    'name': f'Борщ {i}', 'text': 'Варить',
+                    'cooking_time': 60,
+                    'pub_date': '2025-01-01T12:00:00+00:00',
+                    'tags': ['lunch'],
+                    'ingredients': [{'name': 'Свёкла',
+                                     'measurement_unit': 'г',
+                                     'amount': 300}],
+                    'image': None,
+                }, ensure_ascii=False) + '\n')
+
+    def _import(self):
+        call_command('import_recipes', self.path, batch_size=2, workers=1,
+                     stdout=io.StringIO(), stderr=io.StringIO())
+
+    def test_crash_while_saving_position(self):
+        save_progress = Command._save_progress
+        calls = 0
+
+        def fail_second_batch(progress, offset):
+            nonlocal calls
+            calls += 1
+            if calls == 2:
+                raise RuntimeError('сбой')
+            save_progress(progress, offset)
+
+        with mock.patch.object(Command, '_save_progress',
+                               side_effect=fail_second_batch):
+            with self.assertRaises(RuntimeError):
+                self._import()
+        self.assertEqual(Recipe.objects.count(), 2)
+
+        self._import()
+        self._import()
+
+        self.assertEqual(
+            sorted(Recipe.objects.values_list('name', flat=True)),
+            [f'Борщ {i}' for i in range(6)],
+        )
+        self.assertEqual(
+            ImportProgress.objects.get().offset, os.path.getsize(self.path)
+        )
+
+    def test_failed_batch_leaves_no_authors(self):
+        with mock.patch.object(Command, '_save_progress',
+                               side_effect=RuntimeError('сбой')):
+            with self.assertRaises(RuntimeError):
+                self._import()
+        self.assertFalse(Recipe.objects.exists())
+        self.assertFalse(User.objects.exists())
+
+
+class FavoriteSingleStatementTest(RecipesTestCase):
+    recipes_count = 1
+
+    def _queries(self, method, pk):
+        self.auth.get('/api/tags/')
+        with CaptureQueriesContext(connection) as captured:
+            response = getattr(self.auth, method)(
+                f'/api/recipes/{pk}/favorite/'
+            )
+        return response, [
+            query['sql'] for query in captured
+            if 'SAVEPOINT' not in query['sql']
+            and 'authtoken_token' not in query['sql']
+        ]
+
+    def test_post_and_delete_take_one_statement(self):
+        recipe = self.recipes[0]
+        for method, code in (('post', 201), ('post', 400),
+                             ('delete', 204), ('delete', 400)):
+            response, queries = self._queries(method, recipe.pk)
+            self.assertEqual(response.status_code, code)
+            self.assertEqual(len(queries), 1, queries)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.favourites_count, 0)
+
+    def test_created_body(self):
+        recipe = self.recipes[0]
+        response, _ = self._queries('post', recipe.pk)
+        self.assertEqual(response.data['id'], recipe.pk)
+        self.assertEqual(response.data['name'], recipe.name)
+        self.assertEqual(response.data['cooking_time'], recipe.cooking_time)
+        self.assertTrue(response.data['image'].endswith(recipe.image.name))
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.favourites_count, 1)
+
+    def test_missing_and_huge_ids(self):
+        for pk in (10 ** 9, 10 ** 30):
+            response, _ = self._queries('post', pk)
+            self.assertEqual(response.status_code, 404)
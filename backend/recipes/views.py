@@ -1,42 +1,77 @@
 from django.contrib.auth import get_user_model
-from django.db.models import F, Sum
-from django.http import HttpResponse
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.http import Http404
 from django.shortcuts import redirect
+from django.urls import reverse
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
-from rest_framework.generics import get_object_or_404
+from rest_framework.parsers import JSONParser, MultiPartParser
 from rest_framework.permissions import (
     AllowAny,
     IsAuthenticated,
     IsAuthenticatedOrReadOnly,
 )
+from rest_framework.renderers import BrowsableAPIRenderer
 from rest_framework.response import Response
 from rest_framework.viewsets import ReadOnlyModelViewSet
 
-from api.filters import IngredientFilter, RecipeFilter
+from api.filters import RecipeFilter
 from api.permissions import IsAuthorOrReadOnly
+from api.negotiation import FormatContentNegotiation
+from api.renderers import (
+    CSVRenderer,
+    ORJSONRenderer,
+    PDFRenderer,
+    PlainTextRenderer,
+)
 from config import settings
+from recipes import short_links
+from recipes.cache import (
+    INGREDIENTS_VERSION,
+    RECIPES_VERSION,
+    TAGS_VERSION,
+    AnonymousCacheMixin,
+    get_versions,
+    profile_version,
+    user_version,
+)
+from recipes.conditional import ConditionalGetMixin
+from recipes.ingredient_index import ingredient_index
 from recipes.models import (
     Favourites,
     Ingredient,
     Recipe,
-    RecipeIngredient,
     ShoppingList,
+    ShoppingListItem,
     Tag, )
 from recipes.pagination import RecipesPagination
 from recipes.serializers import (
+    FastRecipeSerializer,
     RecipeSerializer,
     IngredientSerializer,
+    RecipeIdsSerializer,
     RecipeMinifiedSerializer,
     RecipeWriteSerializer,
+    ShoppingListItemSerializer,
     TagSerializer,
 )
+from recipes.relations import (
+    ALREADY_PRESENT,
+    NOT_FOUND,
+    NOT_PRESENT,
+    add_relation,
+    add_relations,
+    remove_relation,
+    remove_relations,
+)
+from recipes.shopping_list import ShoppingListBusy, shopping_list_response
 
 User = get_user_model()
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(ConditionalGetMixin, AnonymousCacheMixin,
+                    viewsets.ModelViewSet):
     """
     A view set for managing recipes in the system.
 
@@ -46,45 +81,91 @@ class RecipeViewSet(viewsets.ModelViewSet):
     a short link for a recipe, and managing favorite recipes. It supports
     different serializers depending on the action, allows fine-grained
     permission control, and integrates with custom filtering, pagination,
-    and backend configurations.
+    and backend configurations. Anonymous reads are served from the shared
+    response cache, and all reads support conditional GET.
     """
 
     queryset = Recipe.objects.all().order_by('id')
+    # Не длиннее bigint: иначе int(pk) уходит в базу и падает DataError.
+    lookup_value_regex = r'\d{1,18}'
     permission_classes = [IsAuthenticatedOrReadOnly, IsAuthorOrReadOnly]
     pagination_class = RecipesPagination
     filterset_class = RecipeFilter
     filter_backends = [DjangoFilterBackend]
+    renderer_classes = [ORJSONRenderer, BrowsableAPIRenderer]
+    parser_classes = [JSONParser, MultiPartParser]
 
     relation_model = ShoppingList
     serializer_class = RecipeMinifiedSerializer
+    read_serializer_class = FastRecipeSerializer
+    version_names = (RECIPES_VERSION,)
+
+    def initialize_request(self, request, *args, **kwargs):
+        # Картинка из multipart сразу пишется во временный файл, а не
+        # копится в памяти воркера.
+        if request.method in ('POST', 'PUT', 'PATCH'):
+            request.upload_handlers = [TemporaryFileUploadHandler(request)]
+        return super().initialize_request(request, *args, **kwargs)
 
     def get_serializer_class(self):
         if self.action in ('create', 'update', 'partial_update'):
             return RecipeWriteSerializer
+        if self.action in ('list', 'retrieve'):
+            return self.read_serializer_class
         return RecipeSerializer
 
     def get_queryset(self):
-        return super().get_queryset().with_user_flags(
+        queryset = super().get_queryset()
+        if self.action in ('list', 'retrieve'):
+            queryset = queryset.with_related()
+        elif self.action in ('update', 'partial_update'):
+            queryset = queryset.select_related('author')
+        return queryset.with_user_flags(
             self.request.user
         ).order_by('id')
 
+    def get_version_names(self, request):
+        names = super().get_version_names(request)
+        if request.user.is_authenticated:
+            names.append(user_version(request.user.pk))
+        return names
+
+    def get_object_validators(self, request):
+        lookup = self.kwargs[self.lookup_url_kwarg or self.lookup_field]
+        try:
+            row = Recipe.objects.filter(pk=lookup).values_list(
+                'updated_at', 'author_id'
+            ).first()
+        except (TypeError, ValueError):
+            return None
+        if row is None:
+            return None
+        updated_at, author_id = row
+        names = [profile_version(author_id), TAGS_VERSION,
+                 INGREDIENTS_VERSION]
+        if request.user.is_authenticated:
+            names.append(user_version(request.user.pk))
+        versions = get_versions(*names)
+        versions.append(int(updated_at.timestamp() * 10 ** 9))
+        return self.make_validators(request, versions)
+
     def _handle_relation(self, request, pk, relation_model, serializer_cls):
-        recipe = get_object_or_404(Recipe, pk=pk)
         if request.method == 'POST':
-            obj, created = relation_model.objects.get_or_create(
-                user=request.user, recipe=recipe
-            )
-            if not created:
+            result, recipe = add_relation(relation_model, request.user,
+                                          int(pk))
+            if result == NOT_FOUND:
+                raise Http404
+            if result == ALREADY_PRESENT:
                 return Response({'detail': 'Уже добавлено'},
                                 status=status.HTTP_400_BAD_REQUEST)
             data = serializer_cls(recipe,
                                   context=self.get_serializer_context()).data
             return Response(data, status=status.HTTP_201_CREATED)
 
-        deleted, _ = relation_model.objects.filter(
-            user=request.user, recipe=recipe
-        ).delete()
-        if not deleted:
+        result = remove_relation(relation_model, request.user, int(pk))
+        if result == NOT_FOUND:
+            raise Http404
+        if result == NOT_PRESENT:
             return Response({'detail': 'Не было добавлено'},
                             status=status.HTTP_400_BAD_REQUEST)
         return Response(status=status.HTTP_204_NO_CONTENT)
@@ -107,42 +188,80 @@ class RecipeViewSet(viewsets.ModelViewSet):
             serializer_cls=RecipeMinifiedSerializer
         )
 
-    @action(detail=False, methods=['get'], url_path='download_shopping_cart',
+    def _handle_bulk_relation(self, request, relation_model):
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        handler = (add_relations if request.method == 'POST'
+                   else remove_relations)
+        results = handler(
+            relation_model, request.user,
+            serializer.validated_data['recipes']
+        )
+        return Response({'results': [
+            {'id': pk, 'status': result} for pk, result in results.items()
+        ]})
+
+    @action(detail=False, methods=['post', 'delete'],
+            url_path='shopping_cart', url_name='shopping-cart-bulk',
+            permission_classes=[IsAuthenticated])
+    def shopping_cart_bulk(self, request):
+        """
+        Добавить/удалить сразу несколько рецептов: {"recipes": [id, ...]}.
+        """
+        return self._handle_bulk_relation(request, ShoppingList)
+
+    @action(detail=False, methods=['post', 'delete'],
+            url_path='favorite', url_name='favorite-bulk',
             permission_classes=[IsAuthenticated])
+    def favorite_bulk(self, request):
+        """
+        Добавить/удалить сразу несколько рецептов: {"recipes": [id, ...]}.
+        """
+        return self._handle_bulk_relation(request, Favourites)
+
+    @action(detail=False, methods=['get'], url_path='download_shopping_cart',
+            permission_classes=[IsAuthenticated],
+            renderer_classes=[PlainTextRenderer, CSVRenderer, PDFRenderer],
+            content_negotiation_class=FormatContentNegotiation)
     def download_shopping_cart(self, request):
-        user = request.user
-        qs = (
-            RecipeIngredient.objects
-            .filter(recipe__shoppinglist__user=user)
-            .values(
-                name=F('ingredient__name'),
-                unit=F('ingredient__measurement_unit')
+        """Скачать список покупок: ?format=txt|csv|pdf (по умолчанию txt)."""
+        try:
+            return shopping_list_response(
+                request.user, request.accepted_renderer.format
+            )
+        except ShoppingListBusy:
+            return Response(
+                {'detail': 'Слишком много выгрузок, попробуйте позже.'},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={'Retry-After': '5'},
             )
-            .annotate(total=Sum('amount'))
-            .order_by('name')
-        )
 
-        lines = [f"{i['name']} — {i['total']} {i['unit']}" for i in qs]
-        content = '\n'.join(lines)
-        resp = HttpResponse(content, content_type='text/plain; charset=utf-8')
-        resp[
-            'Content-Disposition'] = 'attachment; filename="shopping_list.txt"'
-        return resp
+    @action(detail=False, methods=['get'], url_path='shopping_cart_summary',
+            permission_classes=[IsAuthenticated])
+    def shopping_cart_summary(self, request):
+        items = (
+            ShoppingListItem.objects
+            .filter(user=request.user.pk, total__gt=0)
+            .select_related('ingredient')
+            .order_by('ingredient__name')
+        )
+        return Response(ShoppingListItemSerializer(items, many=True).data)
 
     @action(detail=True, methods=['get'], url_path='get-link')
     def get_link(self, request, pk=None):
         recipe = self.get_object()
-        rel = f'/s/{recipe.short_url}/'
+        rel = reverse('short-link', args=[short_links.encode(recipe.pk)])
         full = request.build_absolute_uri(rel)
         return Response({'short-link': full})
 
 
-class IngredientViewSet(ReadOnlyModelViewSet):
+class IngredientViewSet(ConditionalGetMixin, ReadOnlyModelViewSet):
     """
     Manages the interaction with the Ingredient resources.
 
     This class provides a viewset for interacting with the Ingredient model. It
-    implements basic filtering and permissions, and it disables specific HTTP
+    serves name autocomplete from an in-memory prefix index ranked by
+    popularity, and it disables specific HTTP
     methods (create, update, partial_update, and destroy). This ensures that
     the Ingredient resources are immutable from client interactions through
     these methods.
@@ -151,12 +270,37 @@ class IngredientViewSet(ReadOnlyModelViewSet):
     serializer_class = IngredientSerializer
     authentication_classes = ()
     permission_classes = (AllowAny,)
-    filter_backends = (DjangoFilterBackend,)
-    filterset_class = IngredientFilter
     pagination_class = None
+    version_names = (INGREDIENTS_VERSION,)
+
+    def get_list_validators(self, request):
+        # Порядок выдачи зависит от популярности, а не только от версии
+        # справочника, поэтому в ETag входит и состояние индекса.
+        digest, built_time_ns = ingredient_index.state()
+        versions = get_versions(*self.get_version_names(request))
+        return self.make_validators(
+            request, [*versions, built_time_ns], digest
+        )
+
+    def list(self, request, *args, **kwargs):
+        """
+        Autocomplete: ?name= is a case-insensitive prefix, ?limit= caps the
+        number of results. Served from the in-memory index.
+        """
+        return self._conditional(
+            request, self.get_list_validators(request), self._search
+        )
+
+    @staticmethod
+    def _search(request):
+        limit = request.query_params.get('limit', '')
+        return Response(ingredient_index.search(
+            request.query_params.get('name', ''),
+            int(limit) if limit.isdigit() else None,
+        ))
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class TagViewSet(ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
     """
     Только чтение: GET /api/tags/ и GET /api/tags/{pk}/
     Любые попытки POST/PATCH/DELETE будут 405 Method Not Allowed
@@ -165,13 +309,12 @@ class TagViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = TagSerializer
     permission_classes = [AllowAny]
     pagination_class = None
+    version_names = (TAGS_VERSION,)
 
 
 def shortlink_redirect(request, code):
     base = settings.FRONTEND_URL
-    try:
-        recipe = Recipe.objects.get(short_url=code)
-    # Не могу понять, почему перестал работать редирект на рецепт
-    except Recipe.DoesNotExist:
+    recipe_id = short_links.resolve(code)
+    if recipe_id is None:
         return redirect(f'{base}/not-found')
-    return redirect(f'{base}/recipes/{recipe.id}')
+    return redirect(f'{base}/recipes/{recipe_id}')
@@ -7,11 +7,33 @@ from django.utils.translation import gettext_lazy as _
 from users.constants import EMAIL_MAX_LENGTH, NAME_MAX_LENGTH
 
 
+class StoredCountersMixin:
+    """
+    Keeps denormalized counters out of saves of existing rows. They are
+    changed only by atomic UPDATEs (`recipes.counters.increment`), and
+    writing back the value the instance was loaded with would undo
+    increments made since then.
+    """
+
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and not field.generated
+                and field.name not in self.counter_fields
+                and field.attname not in deferred
+            ]
+        super().save(*args, **kwargs)
+
+
 def user_avatar_path(instance, filename):
     return f'avatars/{instance.username}/{filename}'
 
 
-class User(AbstractUser):
+class User(StoredCountersMixin, AbstractUser):
     email = models.EmailField(
         'Email',
         unique=True,
@@ -41,6 +63,14 @@ class User(AbstractUser):
         blank=True,
         help_text='Ссылка на аватар (URI)',
     )
+    recipes_count = models.PositiveIntegerField(
+        'Рецептов', default=0, editable=False,
+    )
+    followers_count = models.PositiveIntegerField(
+        'Подписчиков', default=0, editable=False,
+    )
+
+    counter_fields = ('recipes_count', 'followers_count')
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'first_name', 'last_name', ]
@@ -1,11 +1,13 @@
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
 
+from api.instrumentation import InstrumentedSerializerMixin
 from recipes.models import Recipe
 from users.models import Follow, User
 
 
-class AvatarSerializer(serializers.ModelSerializer):
+class AvatarSerializer(InstrumentedSerializerMixin,
+                       serializers.ModelSerializer):
     avatar = Base64ImageField(required=False, allow_null=True)
 
     class Meta:
@@ -18,7 +20,7 @@ class AvatarSerializer(serializers.ModelSerializer):
         return data
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(InstrumentedSerializerMixin, serializers.ModelSerializer):
     """Serializer for user model."""
     avatar = serializers.ImageField(read_only=True)
     is_subscribed = serializers.SerializerMethodField()
@@ -30,16 +32,20 @@ class UserSerializer(serializers.ModelSerializer):
         read_only_fields = ('username', 'email')
 
     def get_is_subscribed(self, obj):
+        subscribed = getattr(obj, 'is_subscribed', None)
+        if subscribed is not None:
+            return subscribed
         request = self.context.get('request')
         return bool(
             request and request.user.is_authenticated
             and Follow.objects.filter(
-                user=request.user, following=obj
+                user=request.user.pk, following=obj
             ).exists()
         )
 
 
-class RecipeMinifiedSerializer(serializers.ModelSerializer):
+class RecipeMinifiedSerializer(InstrumentedSerializerMixin,
+                               serializers.ModelSerializer):
     """Serializer for minimal recipe info in favorites and shopping cart."""
     class Meta:
         model = Recipe
@@ -71,13 +77,17 @@ class UserWithRecipesSerializer(UserSerializer):
         )
 
     def get_recipes(self, obj):
-        qs = Recipe.objects.filter(author=obj).order_by('-pub_date')
-        limit = self.context['request'].query_params.get('recipes_limit')
-        if limit is not None and limit.isdigit():
-            qs = qs[:int(limit)]
+        # Список подписок загружает превью рецептов сразу для всей
+        # страницы, см. UsersViewSet.subscriptions.
+        qs = getattr(obj, 'preview_recipes', None)
+        if qs is None:
+            qs = Recipe.objects.filter(author=obj).order_by('-pub_date')
+            limit = self.context['request'].query_params.get('recipes_limit')
+            if limit is not None and limit.isdigit():
+                qs = qs[:int(limit)]
         return RecipeMinifiedSerializer(
             qs, many=True, context=self.context
         ).data
 
     def get_recipes_count(self, obj):
-        return Recipe.objects.filter(author=obj).count()
+        return obj.recipes_count
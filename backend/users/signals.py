@@ -1,23 +1,46 @@
-from django.db.models.signals import pre_delete, pre_save
+from django.db.models.signals import post_delete, post_init, post_save
 from django.dispatch import receiver
 
-from .models import User
+from recipes.cache import bump_versions_on_commit, user_version
+from recipes.counters import increment
+from recipes.media import delete_files, delete_replaced_files, remember_files
 
+from .models import Follow, User
 
-@receiver(pre_delete, sender=User)
+
+USER_FILES = ('avatar',)
+
+
+@receiver(post_init, sender=User)
+def remember_user_avatar(sender, instance: User, **kwargs):
+    remember_files(instance, USER_FILES)
+
+
+@receiver(post_delete, sender=User)
 def delete_user_avatar(sender, instance: User, **kwargs):
-    if instance.avatar:
-        instance.avatar.delete(save=False)
-
-
-@receiver(pre_save, sender=User)
-def delete_old_user_avatar(sender, instance: User, **kwargs):
-    if not instance.pk:
-        return
-    try:
-        old = User.objects.get(pk=instance.pk)
-    except User.DoesNotExist:
-        return
-    else:
-        if old.avatar and old.avatar != instance.avatar:
-            old.avatar.delete(save=False)
+    delete_files(instance, USER_FILES)
+
+
+@receiver(post_save, sender=User)
+def delete_old_user_avatar(sender, instance: User, update_fields=None,
+                           **kwargs):
+    delete_replaced_files(instance, USER_FILES, update_fields)
+
+
+@receiver(post_save, sender=Follow)
+def count_follower_added(sender, instance: Follow, created, **kwargs):
+    if created:
+        increment(User.objects.filter(pk=instance.following_id),
+                  'followers_count')
+
+
+@receiver(post_delete, sender=Follow)
+def count_follower_removed(sender, instance: Follow, **kwargs):
+    increment(User.objects.filter(pk=instance.following_id),
+              'followers_count', -1)
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def invalidate_follower_flags(sender, instance: Follow, **kwargs):
+    bump_versions_on_commit(user_version(instance.user_id))
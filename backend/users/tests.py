@@ -0,0 +1,151 @@
+import base64
+import io
+import shutil
+import tempfile
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from recipes.cache import RECIPES_VERSION
+from recipes.counters import increment
+from recipes.models import Recipe
+from users.models import Follow, User
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def png_base64():
+    buffer = io.BytesIO()
+    Image.new('RGB', (1, 1)).save(buffer, 'PNG')
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class UserTestCase(TestCase):
+    """An author with a token, a follower and helpers shared by tests."""
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='author@example.com', username='author',
+            first_name='Автор', last_name='Рецептов', password='secret-pass',
+        )
+        self.follower = User.objects.create_user(
+            email='follower@example.com', username='follower',
+            first_name='Под', last_name='Писчик', password='secret-pass',
+        )
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=self.user)}'
+        )
+
+    def _create_recipe(self):
+        return Recipe.objects.create(
+            author=self.user, name='Суп', text='Варить',
+            cooking_time=10, image='recipes/images/soup.png',
+        )
+
+    def _put_avatar(self):
+        return self.client.put(
+            '/api/users/me/avatar/',
+            {'avatar': f'data:image/png;base64,{png_base64()}'},
+            format='json',
+        )
+
+
+class StoredCountersTest(UserTestCase):
+    """Saving a user must not write back stale counter values."""
+
+    def test_save_of_stale_instance_keeps_counters(self):
+        stale = User.objects.get(pk=self.user.pk)
+        increment(User.objects.filter(pk=self.user.pk), 'followers_count')
+        stale.first_name = 'Новое'
+        stale.save()
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.first_name, 'Новое')
+        self.assertEqual(self.user.followers_count, 1)
+
+    def test_avatar_update_keeps_counters(self):
+        # Пользователь попадает в кеш аутентификации до изменения счётчиков.
+        self.client.get('/api/users/me/')
+        self._create_recipe()
+        Follow.objects.create(user=self.follower, following=self.user)
+
+        response = self._put_avatar()
+
+        self.assertEqual(response.status_code, 200)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.avatar)
+        self.assertEqual(self.user.recipes_count, 1)
+        self.assertEqual(self.user.followers_count, 1)
+
+    def test_recipe_save_keeps_favourites_count(self):
+        recipe = self._create_recipe()
+        increment(Recipe.objects.filter(pk=recipe.pk), 'favourites_count')
+        recipe.name = 'Борщ'
+        recipe.save()
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.name, 'Борщ')
+        self.assertEqual(recipe.favourites_count, 1)
+
+
+class AuthorCacheInvalidationTest(UserTestCase):
+    """Only changes visible in recipes drop the shared recipe cache."""
+
+    def _bumped(self, action):
+        with mock.patch('recipes.signals.bump_versions_on_commit') as bump:
+            action()
+        return {name for call in bump.call_args_list for name in call.args}
+
+    def test_users_without_recipes_keep_cache(self):
+        bumped = self._bumped(lambda: User.objects.create_user(
+            email='new@example.com', username='new', first_name='Н',
+            last_name='Н', password='secret-pass',
+        ))
+        self.assertNotIn(RECIPES_VERSION, bumped)
+        self.assertNotIn(RECIPES_VERSION, self._bumped(self._put_avatar))
+
+    def test_other_fields_keep_cache(self):
+        self._create_recipe()
+        user = User.objects.get(pk=self.user.pk)
+
+        def change_password():
+            user.set_password('other-pass')
+            user.save()
+        self.assertEqual(self._bumped(change_password), set())
+
+    def test_author_fields_drop_cache(self):
+        self._create_recipe()
+        user = User.objects.get(pk=self.user.pk)
+
+        def rename():
+            user.first_name = 'Другое'
+            user.save()
+        self.assertIn(RECIPES_VERSION, self._bumped(rename))
+        self.assertIn(RECIPES_VERSION, self._bumped(self._put_avatar))
+
+
+class CachedTokenAuthenticationTest(UserTestCase):
+
+    def test_unsafe_request_loads_fresh_user(self):
+        self.client.get('/api/users/me/')
+        # Профиль поменял другой воркер: сигналы этого процесса не знают.
+        User.objects.filter(pk=self.user.pk).update(first_name='Другое')
+
+        self.assertEqual(self._put_avatar().status_code, 200)
+
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.first_name, 'Другое')
+
+    def test_safe_requests_skip_token_query(self):
+        self.client.get('/api/users/me/')
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/users/me/')
+        self.assertEqual(response.status_code, 200)
@@ -1,3 +1,4 @@
+from django.db.models import BooleanField, Exists, OuterRef, Value
 from django.shortcuts import get_object_or_404
 from djoser.views import UserViewSet
 from rest_framework import status
@@ -6,6 +7,7 @@ from rest_framework.parsers import JSONParser, MultiPartParser
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 
+from recipes.models import Recipe
 from recipes.pagination import RecipesPagination
 from users.models import Follow, User
 from users.serializers import (
@@ -30,6 +32,28 @@ class UsersViewSet(UserViewSet):
     queryset = User.objects.all()
     pagination_class = RecipesPagination
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ('list', 'retrieve'):
+            user = self.request.user
+            queryset = queryset.annotate(is_subscribed=(
+                Exists(Follow.objects.filter(
+                    user=user.pk, following=OuterRef('pk')
+                ))
+                if user.is_authenticated
+                else Value(False, output_field=BooleanField())
+            ))
+        return queryset
+
+    def get_instance(self):
+        # На самого себя подписаться нельзя: флаг известен без запроса.
+        user = self.request.user
+        if not isinstance(user, User):
+            # Токен без состояния несёт только id пользователя.
+            user = User.objects.get(pk=user.pk)
+        user.is_subscribed = False
+        return user
+
     def get_permissions(self):
         if self.action in ('list', 'retrieve', 'create'):
             return [AllowAny()]
@@ -53,7 +77,9 @@ class UsersViewSet(UserViewSet):
             serializer.save()
             return Response(serializer.data, status=status.HTTP_200_OK)
 
-        user.avatar.delete(save=True)
+        # Сам файл удалится после коммита, см. recipes.media.
+        user.avatar = None
+        user.save(update_fields=['avatar'])
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(
@@ -64,7 +90,7 @@ class UsersViewSet(UserViewSet):
         permission_classes=[IsAuthenticated],
     )
     def me_url(self, request):
-        user = request.user
+        user = self.get_instance()
         serializer = self.get_serializer(user, many=False)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
@@ -93,6 +119,7 @@ class UsersViewSet(UserViewSet):
                     {'detail': 'Вы уже подписаны'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
+            author.is_subscribed = True
             data = self.get_serializer(
                 author, context={'request': request}).data
             return Response(data, status=status.HTTP_201_CREATED)
@@ -113,15 +140,28 @@ class UsersViewSet(UserViewSet):
     )
     def subscriptions(self, request):
         user = request.user
-        qs = User.objects.filter(following__user=user)
+        qs = User.objects.filter(following__user=user.pk).annotate(
+            is_subscribed=Value(True, output_field=BooleanField())
+        )
         page = self.paginate_queryset(qs)
-        if page is not None:
-            serializer = UserWithRecipesSerializer(
-                page, many=True, context={'request': request}
-            )
-            return self.get_paginated_response(serializer.data)
-
+        authors = page if page is not None else list(qs)
+        self._attach_preview_recipes(request, authors)
         serializer = UserWithRecipesSerializer(
-            qs, many=True, context={'request': request}
+            authors, many=True, context={'request': request}
         )
+        if page is not None:
+            return self.get_paginated_response(serializer.data)
         return Response(serializer.data)
+
+    @staticmethod
+    def _attach_preview_recipes(request, authors):
+        """Loads recipe previews for all authors of the page at once."""
+        limit = request.query_params.get('recipes_limit')
+        limit = int(limit) if limit is not None and limit.isdigit() else None
+        previews = {author.pk: [] for author in authors}
+        for recipe in Recipe.objects.latest_per_author(
+            list(previews), limit
+        ).only('id', 'name', 'image', 'cooking_time', 'author_id'):
+            previews[recipe.author_id].append(recipe)
+        for author in authors:
+            author.preview_recipes = previews[author.pk]